@@ -0,0 +1,326 @@
+#! /usr/bin/env python
+
+import argparse
+import copy
+import json
+import math
+import os
+import random
+import time
+import timeit
+import players
+from board import Board
+from compact import CompactGame, PersistentGame
+from domino import Domino
+from game import Game
+from hand import Hand
+from rules import Rules, DOUBLE_SIX
+from skinny_board import SkinnyBoard
+from search import alphabeta, iterative_deepening, parallel_alphabeta, SearchStats, \
+    MoveOrdering, doubles_first, heaviest_first
+from simulation import simulate_games
+from transposition import TranspositionTable
+
+
+def seeded_game(seed=0, moves_played=4, rules=DOUBLE_SIX):
+    random.seed(seed)
+    game = Game.new(starting_domino=Domino(rules.max_value, rules.max_value),
+                    rules=rules)
+    for _ in range(moves_played):
+        if game.result is not None:
+            break
+        game.make_move(*game.valid_moves[0])
+    return game
+
+
+def _timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    value = f(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+def root_parallel(seed=0, moves_played=4, workers=(1, 2, 4, 8)):
+    game = seeded_game(seed, moves_played)
+    (moves, value), serial_time = _timed(
+        alphabeta, CompactGame.from_game(game))
+    print('alphabeta: {:.3f}s value {} move {}'.format(
+        serial_time, value, moves[0]))
+
+    for w in workers:
+        (parallel_moves, parallel_value), parallel_time = _timed(
+            parallel_alphabeta, CompactGame.from_game(game), w)
+        assert parallel_value == value and parallel_moves[0] == moves[0]
+        print('{} workers: {:.3f}s speedup {:.2f}x'.format(
+            w, parallel_time, serial_time / parallel_time))
+
+
+def _orderings():
+    return [
+        ('hand order', None),
+        ('doubles first', MoveOrdering(keys=(doubles_first,), tt_move=False,
+                                       killers=False, history=False)),
+        ('heaviest first', MoveOrdering(keys=(heaviest_first,), tt_move=False,
+                                        killers=False, history=False)),
+        ('tt move', MoveOrdering(keys=(), killers=False, history=False)),
+        ('killers', MoveOrdering(keys=(), tt_move=False, history=False)),
+        ('history', MoveOrdering(keys=(), tt_move=False, killers=False)),
+        ('all', MoveOrdering()),
+    ]
+
+
+def compare_orderings(game, table_bytes=2**24):
+    # profundizacion iterativa hasta resolver, para que la tabla y los
+    # killers de cada iteracion ordenen la siguiente
+    nodes = {}
+    for name, ordering in _orderings():
+        stats = SearchStats()
+        iterative_deepening(CompactGame.from_game(game),
+                            table=TranspositionTable(table_bytes),
+                            stats=stats, ordering=ordering)
+        nodes[name] = stats.nodes
+    return nodes
+
+
+def ordering(seed=0, moves_played=4):
+    nodes = compare_orderings(seeded_game(seed, moves_played))
+    for name, n in nodes.items():
+        print('{}: {} nodes ({:.1%} of hand order)'.format(
+            name, n, n / nodes['hand order']))
+
+
+def ismcts_strength(n=20, time_budget=0.2, seed=0):
+    # los dos jugadores tienen el mismo tiempo por decision y cada reparto
+    # se juega desde los dos lados de la mesa
+    wins = {'ismcts': 0, 'probabilistic_alphabeta': 0}
+    for ismcts_team in (0, 1):
+        mcts = players.ismcts(time_budget=time_budget, seed=seed)
+        alphabeta_player = players.probabilistic_alphabeta(
+            sample_size=50, time_budget=time_budget, seed=seed)
+        seats = [mcts, alphabeta_player] if ismcts_team == 0 else [alphabeta_player, mcts]
+        for record in simulate_games(seats * 2, n, seed):
+            if record.winner == ismcts_team:
+                wins['ismcts'] += 1
+            elif record.winner is not None:
+                wins['probabilistic_alphabeta'] += 1
+        print('ismcts on team {}: {} iterations ({:.0f} per second)'.format(
+            ismcts_team, mcts.iterations_run, mcts.iterations_run / mcts.search_time))
+
+    for name, w in wins.items():
+        print('{}: won {} of {} games'.format(name, w, 2 * n))
+
+
+# de menos a mas fichas en juego, a cuatro y a dos jugadores robando
+SCALING_RULES = [Rules(max_value, players, draw=players == 2)
+                 for max_value in (6, 9, 12) for players in (4, 2)]
+
+
+def scaling(seed=0, moves_played=4, depth=8, samples=100, node_budget=10000):
+    # coste de la busqueda a profundidad fija sobre el reparto real, de
+    # contar y muestrear los repartos compatibles y de una decision de
+    # probabilistic_alphabeta con 10 repartos, segun el juego
+    for rules in SCALING_RULES:
+        game = seeded_game(seed, moves_played, rules)
+        # hasta que haya algo que decidir
+        while game.result is None and len(game.valid_moves) == 1:
+            game.make_move(*game.valid_moves[0])
+        stats = SearchStats()
+        _, search_time = _timed(alphabeta, CompactGame.from_game(game),
+                                stats=stats, depth=depth)
+        deals, count_time = _timed(game.count_possible_hands)
+        _, sample_time = _timed(game.sample_possible_hands, samples,
+                                random.Random(seed))
+        player = players.probabilistic_alphabeta(
+            sample_size=10, node_budget=node_budget, seed=seed)
+        _, decision_time = _timed(player, copy.deepcopy(game))
+        print(rules)
+        print('  depth {} search: {} nodes in {:.3f}s ({:.0f} nodes/s,'
+              ' branching {:.2f})'.format(depth, stats.nodes, search_time,
+                                          stats.nodes / search_time,
+                                          stats.mean_branching()))
+        print('  deals: 10^{:.1f}, counted in {:.3f}s, {} samples in {:.3f}s'.format(
+            math.log10(deals), count_time, samples, sample_time))
+        print('  probabilistic_alphabeta decision: {:.3f}s'.format(decision_time))
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'benchmark_baseline.json')
+
+# jugadas hechas con seeded_game(0, ...) en cada fase de la partida; en
+# las tres el jugador en turno tiene mas de un movimiento posible
+STAGES = {'early': 3, 'middle': 9, 'late': 17}
+
+
+def _make_unmake(game):
+    move = game.valid_moves[0]
+
+    def run():
+        game.make_move(*move)
+        game.unmake_move()
+    return run
+
+
+def _board_add(board, game):
+    for move in game.moves:
+        board.add(*move)
+    move = game.valid_moves[0]
+
+    def run():
+        board.add(*move)
+        board.remove(*move)
+    return run
+
+
+def _dominoes():
+    dominoes = [Domino(i, j) for i in range(7) for j in range(i, 7)]
+    inverted = [d.inverted() for d in dominoes]
+
+    def run():
+        for a, b in zip(dominoes, inverted):
+            a == b
+            hash(a)
+    return run
+
+
+def _hand_play():
+    hand = Hand(Domino(i, 6) for i in range(7))
+    d = Domino(6, 5)
+
+    def run():
+        hand.draw(d, hand.play(d))
+    return run
+
+
+def _decision(player_factory, game):
+    # un jugador nuevo en cada llamada, para que todas partan de lo mismo
+    def run():
+        player_factory()(game)
+    return run
+
+
+def suite_cases():
+    cases = {}
+    for stage, moves_played in STAGES.items():
+        def game(moves_played=moves_played):
+            return seeded_game(0, moves_played)
+
+        cases['Game.make_move/' + stage] = lambda game=game: _make_unmake(game())
+        cases['Game._update_valid_moves/' + stage] = \
+            lambda game=game: game()._update_valid_moves
+        cases['Game.__deepcopy__/' + stage] = \
+            lambda game=game: lambda g=game(): copy.deepcopy(g)
+        cases['Board.add/' + stage] = lambda game=game: _board_add(Board(), game())
+        cases['SkinnyBoard.add/' + stage] = \
+            lambda game=game: _board_add(SkinnyBoard(), game())
+        cases['Game.random_possible_hands/' + stage] = \
+            lambda game=game: lambda g=game(): g.random_possible_hands(random.Random(0))
+        cases['alphabeta/' + stage] = \
+            lambda game=game: lambda g=CompactGame.from_game(game()): alphabeta(g)
+        # el mismo arbol con Game y deepcopy, donde mas se comparan fichas;
+        # sin deshacer, el ultimo hijo se juega sobre el propio juego
+        cases['alphabeta.game/' + stage] = lambda game=game: \
+            lambda g=game(): alphabeta(copy.deepcopy(g), in_place=False)
+        # copiando en cada hijo, que con PersistentGame no crece con la partida
+        cases['PersistentGame.__deepcopy__/' + stage] = lambda game=game: \
+            lambda g=PersistentGame.from_game(game()): copy.deepcopy(g)
+        cases['alphabeta.persistent/' + stage] = lambda game=game: \
+            lambda g=PersistentGame.from_game(game()): alphabeta(copy.copy(g), in_place=False)
+        cases['omniscient/' + stage] = \
+            lambda game=game: _decision(players.omniscient, game())
+        cases['probabilistic_alphabeta/' + stage] = lambda game=game: _decision(
+            lambda: players.probabilistic_alphabeta(
+                sample_size=20, seed=0, node_budget=20000), game())
+
+    cases['Game.all_possible_hands/late'] = \
+        lambda: lambda g=seeded_game(0, STAGES['late']): list(g.all_possible_hands())
+    cases['Domino.__eq__+__hash__'] = _dominoes
+    cases['Hand.play+draw'] = _hand_play
+    return cases
+
+
+def run_suite(names=None, repeat=5):
+    # mejor tiempo por llamada de varias repeticiones, como timeit
+    results = {}
+    for name, setup in suite_cases().items():
+        if names is not None and not any(n in name for n in names):
+            continue
+        timer = timeit.Timer(setup())
+        number, _ = timer.autorange()
+        results[name] = min(timer.repeat(repeat, number)) / number
+    return results
+
+
+def compare(results, baseline):
+    lines = []
+    for name, seconds in results.items():
+        line = '{:<40} {:>12.3f} us'.format(name, seconds * 1e6)
+        if name in baseline:
+            line += ' {:>+8.1%}'.format(seconds / baseline[name] - 1)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def suite(names=None, repeat=5, baseline=None, save=None):
+    results = run_suite(names, repeat)
+    base = {}
+    if baseline is not None and os.path.exists(baseline):
+        with open(baseline) as f:
+            base = json.load(f)
+    print(compare(results, base))
+    if save is not None:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del motor.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    parser_root = subparsers.add_parser('root-parallel')
+    parser_root.add_argument('--seed', type=int, default=0)
+    parser_root.add_argument('--moves-played', type=int, default=4)
+    parser_root.add_argument('--workers', type=int, nargs='+',
+                             default=[1, 2, 4, 8])
+
+    parser_ordering = subparsers.add_parser('ordering')
+    parser_ordering.add_argument('--seed', type=int, default=0)
+    parser_ordering.add_argument('--moves-played', type=int, default=4)
+
+    parser_ismcts = subparsers.add_parser('ismcts')
+    parser_ismcts.add_argument('-n', type=int, default=20)
+    parser_ismcts.add_argument('--time-budget', type=float, default=0.2)
+    parser_ismcts.add_argument('--seed', type=int, default=0)
+
+    parser_scaling = subparsers.add_parser(
+        'scaling', help='coste de busqueda y muestreo segun el juego de fichas')
+    parser_scaling.add_argument('--seed', type=int, default=0)
+    parser_scaling.add_argument('--moves-played', type=int, default=4)
+    parser_scaling.add_argument('--depth', type=int, default=8)
+    parser_scaling.add_argument('--samples', type=int, default=100)
+    parser_scaling.add_argument('--node-budget', type=int, default=10000)
+
+    parser_suite = subparsers.add_parser(
+        'suite', help='tiempos de las partes criticas, comparados con una base')
+    parser_suite.add_argument('names', nargs='*',
+                              help='solo los casos que contienen alguno de estos textos')
+    parser_suite.add_argument('--repeat', type=int, default=5)
+    parser_suite.add_argument('--baseline', default=BASELINE,
+                              help='JSON con tiempos anteriores')
+    parser_suite.add_argument('--save', default=None,
+                              help='guarda los tiempos en este JSON')
+
+    args = parser.parse_args()
+    if args.benchmark == 'root-parallel':
+        root_parallel(args.seed, args.moves_played, args.workers)
+    elif args.benchmark == 'ordering':
+        ordering(args.seed, args.moves_played)
+    elif args.benchmark == 'ismcts':
+        ismcts_strength(args.n, args.time_budget, args.seed)
+    elif args.benchmark == 'scaling':
+        scaling(args.seed, args.moves_played, args.depth, args.samples,
+                args.node_budget)
+    elif args.benchmark == 'suite':
+        suite(args.names or None, args.repeat, args.baseline, args.save)
+
+
+if __name__ == '__main__':
+    main()
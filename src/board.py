@@ -1,5 +1,6 @@
 import collections
 from exceptions import EmptyBoardException, EndsMismatchException
+import zobrist
 
 class Board:
     def __init__(self):
@@ -51,6 +52,21 @@ class Board:
         else:
             self._add_right(d)
 
+    def remove(self, d, left):
+        try:
+            if left:
+                self.board.popleft()
+            else:
+                self.board.pop()
+        except IndexError:
+            raise EmptyBoardException('Cannot remove {} from the board'
+                                      ' because it is empty!'.format(d))
+
+    def zobrist_hash(self):
+        if not self:
+            return 0
+        return zobrist.ends_hash(self.left_end(), self.right_end())
+
     def __eq__(self, other):
         if not isinstance(other, type(self)):
             return False
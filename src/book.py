@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+
+import argparse
+import collections
+import os
+import random
+import struct
+from compact import CompactGame, LEFT_MOVES, RIGHT_MOVES, domino_index, hand_mask
+from domino import Domino
+from game import Game
+from rules import DOUBLE_SIX
+from search import iterative_deepening
+
+# La clave de una posicion es lo que sabe el jugador que mueve: su mano
+# (28 bits) y la historia publica, 6 bits por movimiento a partir del bit
+# 28 (indice << 1 | izquierda, mas uno; 57 es pasar). El turno no hace
+# falta, se deduce del numero de movimientos.
+#
+# Fichero: cabecera (magia, numero de registros) y un registro por clave
+# y movimiento, ordenados por clave.
+
+MAGIC = b'DBK1'
+HEADER = struct.Struct('<4sI')
+RECORD = struct.Struct('<16sBIf')
+KEY_BYTES = 16
+MAX_PLIES = (8 * KEY_BYTES - 28) // 6
+PASS = 56
+
+
+def _move_code(move):
+    if move is None:
+        return PASS
+    d, left = move
+    return domino_index(d) << 1 | left
+
+
+def _code_move(code):
+    return LEFT_MOVES[code >> 1] if code & 1 else RIGHT_MOVES[code >> 1]
+
+
+def position_key(game):
+    # el libro es del doble seis a cuatro jugadores
+    if len(game.moves) > MAX_PLIES or game.rules != DOUBLE_SIX:
+        return None
+    key = hand_mask(game.hands[game.turn])
+    for i, move in enumerate(game.moves):
+        key |= (_move_code(move) + 1) << 28 + 6 * i
+    return key
+
+
+class Book:
+    '''
+    Move statistics aggregated over many determinized searches, indexed by
+    the information the player to move has. For each move it keeps how
+    many searches chose it and the sum of their values for the mover.
+    '''
+    def __init__(self):
+        self._entries = collections.defaultdict(dict)
+
+    @classmethod
+    def load(cls, path):
+        book = cls()
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('{} is not an opening book file'.format(path))
+        for key, code, votes, value in RECORD.iter_unpack(
+                data[HEADER.size:HEADER.size + RECORD.size * count]):
+            book._entries[int.from_bytes(key, 'little')][code] = [votes, value]
+        return book
+
+    def save(self, path):
+        records = [(key, code, votes, value)
+                   for key, moves in self._entries.items()
+                   for code, (votes, value) in moves.items()]
+        records.sort()
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(records)))
+            for key, code, votes, value in records:
+                f.write(RECORD.pack(key.to_bytes(KEY_BYTES, 'little'),
+                                    code, votes, value))
+
+    def record(self, game, move, value, votes=1):
+        key = position_key(game)
+        if key is None:
+            return
+        stats = self._entries[key].setdefault(_move_code(move), [0, 0.0])
+        stats[0] += votes
+        stats[1] += value
+
+    def moves(self, game):
+        # (movimiento, votos, valor medio) de mas a menos votado
+        moves = self._entries.get(position_key(game), {})
+        return sorted(((_code_move(code), votes, value / votes)
+                       for code, (votes, value) in moves.items()),
+                      key=lambda m: (-m[1], -m[2]))
+
+    def lookup(self, game, min_votes=1):
+        moves = self._entries.get(position_key(game))
+        if not moves:
+            return None
+        code, (votes, value) = max(moves.items(),
+                                   key=lambda m: (m[1][0], m[1][1] / m[1][0]))
+        if votes < min_votes:
+            return None
+        return _code_move(code)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _search(game, book, sample_size, node_budget, rng):
+    # una busqueda por reparto; el valor se guarda desde el punto de
+    # vista de quien mueve
+    sign = -1 if game.turn % 2 else 1
+    votes = collections.Counter()
+    for hands in game.sample_possible_hands(sample_size, rng):
+        moves, value = iterative_deepening(CompactGame.from_game(game, hands),
+                                           node_budget=node_budget)
+        move = next(m for m in game.valid_moves if m == moves[0])
+        book.record(game, move, sign * value)
+        votes[move] += 1
+    return votes.most_common(1)[0][0]
+
+
+def build(book, games=100, plies=4, sample_size=20, node_budget=2000,
+          seed=0, starting_domino=Domino(6, 6)):
+    # cada partida sigue el movimiento mas votado, asi el libro cubre las
+    # lineas que se juegan de verdad
+    rng = random.Random(seed)
+    for _ in range(games):
+        game = Game.new(starting_domino=starting_domino, rng=rng)
+        while game.result is None and len(game.moves) < plies:
+            if len(game.valid_moves) == 1:
+                game.make_move(*game.valid_moves[0])
+                continue
+            game.make_move(*_search(game, book, sample_size, node_budget, rng))
+    return book
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera el libro de aperturas.')
+    parser.add_argument('path', help='si ya existe, se añaden las nuevas busquedas')
+    parser.add_argument('-n', type=int, default=100, help='partidas')
+    parser.add_argument('--plies', type=int, default=4,
+                        help='movimientos de cada partida, contando la salida')
+    parser.add_argument('--sample-size', type=int, default=20)
+    parser.add_argument('--node-budget', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.plies > MAX_PLIES:
+        parser.error('--plies must be at most {}'.format(MAX_PLIES))
+
+    book = Book.load(args.path) if os.path.exists(args.path) else Book()
+    build(book, args.n, args.plies, args.sample_size, args.node_budget, args.seed)
+    book.save(args.path)
+    print('{} positions in the book.'.format(len(book)))
+
+
+if __name__ == '__main__':
+    main()
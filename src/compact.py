@@ -0,0 +1,543 @@
+import copy
+from domino import Domino, MAX_VALUE
+from hand import Hand
+from result import Result
+from rules import DOUBLE_SIX
+from skinny_board import SkinnyBoard
+from exceptions import NoSuchDominoException, EndsMismatchException, GameOverException, \
+    NoMovesException
+import zobrist
+
+# cada domino es un bit: [a|b] con a <= b ocupa el bit b * (b + 1) / 2 + a,
+# asi que las fichas de un juego son los primeros bits de uno mas grande y
+# las tablas hasta el doble doce sirven para todos
+_DOMINOES = [Domino(low, high) for high in range(MAX_VALUE + 1)
+             for low in range(high + 1)]
+_PIPS = [d.pips for d in _DOMINOES]
+_VALUE_MASKS = [sum(1 << i for i, d in enumerate(_DOMINOES) if v in d)
+                for v in range(MAX_VALUE + 1)]
+_LEFT_MOVES = [(d, True) for d in _DOMINOES]
+_RIGHT_MOVES = [(d, False) for d in _DOMINOES]
+
+# las del doble seis, para las tablas de finales, el libro y los registros
+DOMINOES = list(DOUBLE_SIX.dominoes)
+ALL_DOMINOES = (1 << len(DOMINOES)) - 1
+PIPS = _PIPS[:len(DOMINOES)]
+VALUE_MASKS = [m & ALL_DOMINOES for m in _VALUE_MASKS[:DOUBLE_SIX.max_value + 1]]
+LEFT_MOVES = _LEFT_MOVES[:len(DOMINOES)]
+RIGHT_MOVES = _RIGHT_MOVES[:len(DOMINOES)]
+
+
+def domino_index(d):
+    return d.id
+
+
+def hand_mask(hand):
+    mask = 0
+    for d in hand:
+        mask |= 1 << domino_index(d)
+    return mask
+
+
+def mask_dominoes(mask):
+    dominoes = []
+    while mask:
+        low = mask & -mask
+        dominoes.append(_DOMINOES[low.bit_length() - 1])
+        mask ^= low
+    return dominoes
+
+
+def mask_hash(mask):
+    h = 0
+    while mask:
+        low = mask & -mask
+        h ^= zobrist.DOMINO_KEYS[low.bit_length() - 1]
+        mask ^= low
+    return h
+
+
+def mask_points(mask):
+    points = 0
+    while mask:
+        low = mask & -mask
+        points += _PIPS[low.bit_length() - 1]
+        mask ^= low
+    return points
+
+
+def _valid_moves(hand, left, right):
+    left_mask = hand & _VALUE_MASKS[left]
+    if left != right:
+        right_mask = hand & _VALUE_MASKS[right]
+    else:
+        right_mask = 0
+
+    moves = []
+    mask = left_mask | right_mask
+    while mask:
+        low = mask & -mask
+        i = low.bit_length() - 1
+        if left_mask & low:
+            moves.append(_LEFT_MOVES[i])
+        if right_mask & low:
+            moves.append(_RIGHT_MOVES[i])
+        mask ^= low
+
+    return tuple(moves)
+
+
+def _stuck_result(turn, points, rules):
+    team_points = [0, 0]
+    for player, player_points in enumerate(points):
+        team_points[rules.teams[player]] += player_points
+
+    if team_points[0] < team_points[1]:
+        return Result(turn, False, sum(team_points))
+    elif team_points[0] == team_points[1]:
+        return Result(turn, False, 0)
+    else:
+        return Result(turn, False, -sum(team_points))
+
+
+class _BitmaskGame:
+    '''
+    What CompactGame and PersistentGame answer the same way from their
+    hand bitmasks and board ends. Subclasses give the number of
+    dominoes left in the boneyard with _boneyard_size.
+    '''
+    def to_hands(self):
+        return [Hand(mask_dominoes(h)) for h in self.hands]
+
+    def skinny_board(self):
+        return SkinnyBoard(self.left, self.right, self.length)
+
+    def holds_value(self, player, value):
+        return bool(self.hands[player] & _VALUE_MASKS[value])
+
+    def remaining_dominoes(self):
+        return self.rules.remaining_dominoes(
+            sum(h.bit_count() for h in self.hands), self._boneyard_size())
+
+    def ends(self):
+        return self.left, self.right
+
+    def __eq__(self, other):
+        if not isinstance(other, type(self)):
+            return False
+
+        return self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        string_list = ['Board: {}'.format(self.skinny_board())]
+
+        for i, hand in enumerate(self.hands):
+            string_list.append("Player {}'s hand: {}".format(
+                i, ''.join(str(d) for d in mask_dominoes(hand))))
+
+        return '\n'.join(string_list)
+
+    def __repr__(self):
+        return str(self)
+
+
+class CompactGame(_BitmaskGame):
+    '''
+    Game state for search: each hand is a bitmask of the dominoes it
+    holds and the board is reduced to its two ends. Moves are the same
+    (Domino, bool) tuples that Game uses. The boneyard is a list of
+    domino indices, drawn from the end.
+    '''
+    def __init__(self, hands, left, right, length, turn, valid_moves, result,
+                 rules=DOUBLE_SIX, boneyard=()):
+        self.hands = list(hands)
+        self.left = left
+        self.right = right
+        self.length = length
+        self.turn = turn
+        self.valid_moves = valid_moves
+        self.result = result
+        self.rules = rules
+        self.boneyard = list(boneyard)
+        self._points = [mask_points(h) for h in self.hands]
+        self._hashes = [mask_hash(h) for h in self.hands]
+        self._history = []
+        # robos: (movimientos en _history al robar, jugador, fichas robadas)
+        self._draws = []
+
+    @classmethod
+    def from_game(cls, game, hands=None):
+        # hands puede venir de Game.sample_possible_hands, con el monton al final
+        players = game.rules.players
+        if hands is None or len(hands) == players:
+            boneyard = game.boneyard
+        else:
+            boneyard = hands[players]
+        if hands is None:
+            hands = game.hands
+
+        if game.board:
+            left = game.board.left_end()
+            right = game.board.right_end()
+        else:
+            left = None
+            right = None
+
+        return cls([hand_mask(h) for h in hands[:players]], left, right,
+                   len(game.board), game.turn, game.valid_moves, game.result,
+                   game.rules, [domino_index(d) for d in boneyard])
+
+    def _playable(self, player):
+        return self.hands[player] & (_VALUE_MASKS[self.left] |
+                                     _VALUE_MASKS[self.right])
+
+    def _update_valid_moves(self):
+        self.valid_moves = _valid_moves(self.hands[self.turn], self.left, self.right)
+
+    def _draw(self, player):
+        # roba hasta tener una ficha jugable o vaciar el monton
+        ends = _VALUE_MASKS[self.left] | _VALUE_MASKS[self.right]
+        drawn = []
+        while self.boneyard:
+            i = self.boneyard.pop()
+            drawn.append(i)
+            self.hands[player] |= 1 << i
+            self._points[player] += _PIPS[i]
+            self._hashes[player] ^= zobrist.DOMINO_KEYS[i]
+            if ends & 1 << i:
+                break
+        self._draws.append((len(self._history), player, drawn))
+        return self.hands[player] & ends
+
+    def make_move(self, d, left):
+        if self.result is not None:
+            raise GameOverException(
+                'Cannot make a move - the game is over!')
+
+        i = domino_index(d)
+        bit = 1 << i
+        if not self.hands[self.turn] & bit:
+            raise NoSuchDominoException('Cannot make move -'
+                                        ' {} is not in hand!'.format(d))
+
+        old_left = self.left
+        old_right = self.right
+        if self.left is None:
+            self.left = d.first
+            self.right = d.second
+        elif left:
+            if self.left not in d:
+                raise EndsMismatchException(
+                    '{} cannot be added to the left of'
+                    ' the board - values do not match!'.format(d)
+                )
+            self.left = _PIPS[i] - self.left
+        else:
+            if self.right not in d:
+                raise EndsMismatchException(
+                    '{} cannot be added to the right of'
+                    ' the board - values do not match!'.format(d)
+                )
+            self.right = _PIPS[i] - self.right
+
+        self._history.append((self.turn, self.valid_moves, old_left, old_right, i))
+        self.length += 1
+        self.hands[self.turn] ^= bit
+        self._points[self.turn] -= _PIPS[i]
+        self._hashes[self.turn] ^= zobrist.DOMINO_KEYS[i]
+
+        rules = self.rules
+        if not self.hands[self.turn]:
+            self.valid_moves = ()
+            self.result = Result(
+                self.turn, True, rules.team_sign(self.turn) * sum(self._points)
+            )
+            return self.result
+
+        players = rules.players
+        for _ in range(players):
+            self.turn = (self.turn + 1) % players
+            if self._playable(self.turn) or \
+                    rules.draw and self.boneyard and self._draw(self.turn):
+                self._update_valid_moves()
+                return
+
+        self.valid_moves = ()
+        self.result = _stuck_result(self.turn, self._points, rules)
+        return self.result
+
+    def unmake_move(self):
+        n = len(self._history)
+        try:
+            turn, valid_moves, left, right, i = self._history.pop()
+        except IndexError:
+            raise NoMovesException(
+                'Cannot unmake a move - no moves have been made!')
+
+        while self._draws and self._draws[-1][0] == n:
+            _, player, drawn = self._draws.pop()
+            for j in reversed(drawn):
+                self.hands[player] ^= 1 << j
+                self._points[player] -= _PIPS[j]
+                self._hashes[player] ^= zobrist.DOMINO_KEYS[j]
+                self.boneyard.append(j)
+
+        self.hands[turn] |= 1 << i
+        self._points[turn] += _PIPS[i]
+        self._hashes[turn] ^= zobrist.DOMINO_KEYS[i]
+        self.left = left
+        self.right = right
+        self.length -= 1
+        self.turn = turn
+        self.valid_moves = valid_moves
+        self.result = None
+
+    def _boneyard_size(self):
+        return len(self.boneyard)
+
+    def remaining_points(self):
+        return list(self._points)
+
+    def zobrist_hash(self):
+        h = zobrist.ends_hash(self.left, self.right) ^ zobrist.TURN_KEYS[self.turn]
+        for player, hand_hash in enumerate(self._hashes):
+            h ^= zobrist.player_hash(hand_hash, player)
+        if self.rules.draw and self.boneyard:
+            h ^= zobrist.boneyard_hash(self.boneyard)
+        return h
+
+    def __deepcopy__(self, _):
+        game = type(self)(self.hands, self.left, self.right, self.length,
+                          self.turn, self.valid_moves, self.result,
+                          self.rules, self.boneyard)
+        game._history = list(self._history)
+        game._draws = list(self._draws)
+        return game
+
+
+def _linked(items):
+    # lista enlazada de tuplas (cabeza, resto), con el ultimo elemento en cabeza
+    node = None
+    for item in items:
+        node = (item, node)
+    return node
+
+
+def _unlinked(node):
+    items = []
+    while node is not None:
+        item, node = node
+        items.append(item)
+    items.reverse()
+    return items
+
+
+# clave de cada ficha en la mano de cada jugador, como en zobrist.player_hash
+_PLAYER_KEYS = [[zobrist.player_hash(key, player) for key in zobrist.DOMINO_KEYS]
+                for player in range(4)]
+
+
+def _hands_hash(hands):
+    h = 0
+    for player, hand in enumerate(hands):
+        h ^= zobrist.player_hash(mask_hash(hand), player)
+    return h
+
+
+class PersistentGame(_BitmaskGame):
+    '''
+    Game state made of parts that are never modified, only replaced:
+    hands are a tuple of bitmasks, the board is its two ends, and the move
+    log, the boneyard and the undo history are linked lists shared with
+    the states they were derived from. Copying is O(1) and make_move
+    allocates the same whatever the length of the game, so search can
+    branch by copying (in_place=False) and determinizations of one
+    position share everything but the hands.
+    '''
+    def __init__(self, hands, left, right, length, turn, valid_moves, result,
+                 rules=DOUBLE_SIX, boneyard=(), log=None):
+        self.hands = tuple(hands)
+        self.left = left
+        self.right = right
+        self.length = length
+        self.turn = turn
+        self.valid_moves = valid_moves
+        self.result = result
+        self.rules = rules
+        # el monton se roba por la cabeza, que es el final de la lista
+        self.boneyard = _linked(boneyard)
+        self.boneyard_size = len(boneyard)
+        # movimientos hechos, con None al pasar, el ultimo en cabeza
+        self.log = log
+        # hash de las manos, con la clave de cada ficha rotada por jugador
+        self._hash = _hands_hash(self.hands)
+        # el estado anterior a cada movimiento, para unmake_move
+        self._previous = None
+
+    @classmethod
+    def from_game(cls, game, hands=None):
+        state = CompactGame.from_game(game, hands)
+        return cls(state.hands, state.left, state.right, state.length,
+                   state.turn, state.valid_moves, state.result, state.rules,
+                   state.boneyard, _linked(game.moves))
+
+    def with_hands(self, hands):
+        # el mismo estado con otras manos (y monton), por ejemplo un reparto
+        # de Game.sample_possible_hands; el resto se comparte
+        players = self.rules.players
+        state = copy.copy(self)
+        state.hands = tuple(hand_mask(h) for h in hands[:players])
+        if len(hands) > players:
+            state.boneyard = _linked(domino_index(d) for d in hands[players])
+            state.boneyard_size = len(hands[players])
+        state._hash = _hands_hash(state.hands)
+        state._previous = None
+        return state
+
+    def moves(self):
+        return _unlinked(self.log)
+
+    def make_move(self, d, left):
+        if self.result is not None:
+            raise GameOverException(
+                'Cannot make a move - the game is over!')
+
+        i = domino_index(d)
+        bit = 1 << i
+        turn = self.turn
+        if not self.hands[turn] & bit:
+            raise NoSuchDominoException('Cannot make move -'
+                                        ' {} is not in hand!'.format(d))
+
+        left_end = self.left
+        right_end = self.right
+        if left_end is None:
+            left_end = d.first
+            right_end = d.second
+        elif left:
+            if left_end not in d:
+                raise EndsMismatchException(
+                    '{} cannot be added to the left of'
+                    ' the board - values do not match!'.format(d)
+                )
+            left_end = _PIPS[i] - left_end
+        else:
+            if right_end not in d:
+                raise EndsMismatchException(
+                    '{} cannot be added to the right of'
+                    ' the board - values do not match!'.format(d)
+                )
+            right_end = _PIPS[i] - right_end
+
+        self._previous = (self.hands, self.left, self.right, turn,
+                          self.valid_moves, self.boneyard, self.boneyard_size,
+                          self.log, self._hash, self._previous)
+        hands = list(self.hands)
+        hands[turn] ^= bit
+        self._hash ^= _PLAYER_KEYS[turn][i]
+        self.left = left_end
+        self.right = right_end
+        self.length += 1
+        self.log = ((d, left), self.log)
+
+        rules = self.rules
+        if not hands[turn]:
+            self.valid_moves = ()
+            # las manos no comparten fichas: sus puntos son los de la union
+            unplayed = 0
+            for h in hands:
+                unplayed |= h
+            self.result = Result(turn, True, rules.team_sign(turn) *
+                                 mask_points(unplayed))
+        else:
+            ends = _VALUE_MASKS[left_end] | _VALUE_MASKS[right_end]
+            players = rules.players
+            passes = 0
+            for _ in range(players):
+                turn = (turn + 1) % players
+                if not hands[turn] & ends and rules.draw:
+                    # se roba hasta poder jugar o vaciar el monton
+                    while self.boneyard is not None:
+                        j, self.boneyard = self.boneyard
+                        self.boneyard_size -= 1
+                        hands[turn] |= 1 << j
+                        self._hash ^= _PLAYER_KEYS[turn][j]
+                        if ends & 1 << j:
+                            break
+                if hands[turn] & ends:
+                    self.valid_moves = _valid_moves(hands[turn], left_end, right_end)
+                    for _ in range(passes):
+                        self.log = (None, self.log)
+                    break
+                passes += 1
+            else:
+                self.valid_moves = ()
+                self.result = _stuck_result(
+                    turn, [mask_points(h) for h in hands], rules)
+
+        self.turn = turn
+        self.hands = tuple(hands)
+        return self.result
+
+    def play(self, d, left):
+        # como make_move, pero devuelve el estado nuevo sin tocar este
+        state = copy.copy(self)
+        state.make_move(d, left)
+        return state
+
+    def unmake_move(self):
+        if self._previous is None:
+            raise NoMovesException(
+                'Cannot unmake a move - no moves have been made!')
+
+        (self.hands, self.left, self.right, self.turn, self.valid_moves,
+         self.boneyard, self.boneyard_size, self.log, self._hash,
+         self._previous) = self._previous
+        self.length -= 1
+        self.result = None
+
+    def _boneyard_size(self):
+        return self.boneyard_size
+
+    def remaining_points(self):
+        # no se mantienen al jugar: solo hacen falta al final y al evaluar
+        return [mask_points(h) for h in self.hands]
+
+    def zobrist_hash(self):
+        h = zobrist.ends_hash(self.left, self.right) ^ \
+            zobrist.TURN_KEYS[self.turn] ^ self._hash
+        if self.rules.draw and self.boneyard is not None:
+            h ^= zobrist.boneyard_hash(_unlinked(self.boneyard))
+        return h
+
+    def __copy__(self):
+        # las partes no cambian nunca, asi que basta con compartirlas; se
+        # asignan en el orden de __init__ para que el objeto tenga la misma
+        # forma y el acceso a sus atributos siga siendo rapido
+        game = type(self).__new__(type(self))
+        game.hands = self.hands
+        game.left = self.left
+        game.right = self.right
+        game.length = self.length
+        game.turn = self.turn
+        game.valid_moves = self.valid_moves
+        game.result = self.result
+        game.rules = self.rules
+        game.boneyard = self.boneyard
+        game.boneyard_size = self.boneyard_size
+        game.log = self.log
+        game._hash = self._hash
+        game._previous = self._previous
+        return game
+
+    def __deepcopy__(self, _):
+        return self.__copy__()
+
+    def __setstate__(self, state):
+        # al deserializar (en los procesos de probabilistic_alphabeta), por
+        # lo mismo que en __copy__
+        for name, value in state.items():
+            setattr(self, name, value)
@@ -3,7 +3,39 @@ import collections
 # utilizando el estandar singleton
 DominoBase = collections.namedtuple('DominoBase', ['first', 'second'])
 
+# las fichas hasta el doble doce y sus inversiones, creadas una sola vez
+MAX_VALUE = 12
+_TABLE = {}
+
+
 class Domino(DominoBase):
+    '''
+    Domino(a, b) returns the same instance every time for values 0-12, with
+    its canonical id (b * (b + 1) / 2 + a for a <= b, the same for [a|b]
+    and [b|a]), pip sum, value bitmask and hash precomputed, so equality
+    and hashing do not build tuples. Other values (like the '?' used to
+    draw a SkinnyBoard) get a plain instance.
+    '''
+    def __new__(cls, first, second):
+        try:
+            return _TABLE[first, second]
+        except (KeyError, TypeError):
+            pass
+
+        self = super().__new__(cls, first, second)
+        self.id = None
+        return self
+
+    @classmethod
+    def _intern(cls, first, second):
+        self = super().__new__(cls, first, second)
+        low, high = sorted((first, second))
+        self.id = high * (high + 1) // 2 + low
+        self.pips = first + second
+        self.values = 1 << first | 1 << second
+        self._hash = hash((low, high))
+        _TABLE[first, second] = self
+
     def inverted(self):
         return Domino(self.second, self.first)
 
@@ -14,16 +46,37 @@ class Domino(DominoBase):
         return str(self)
 
     def __eq__(self, other):
-        if not isinstance(other, type(self)):
+        if self is other:
+            return True
+        if not isinstance(other, Domino):
             return False
-        return sorted((self.first, self.second)) == \
-            sorted((other.first, other.second))
+        if self.id is None or other.id is None:
+            return sorted((self.first, self.second)) == \
+                sorted((other.first, other.second))
+        return self.id == other.id
 
     def __ne__(self, other):
         return not self == other
 
     def __hash__(self):
-        return hash(tuple(sorted((self.first, self.second))))
+        if self.id is None:
+            return hash(tuple(sorted((self.first, self.second))))
+        return self._hash
 
     def __contains__(self, key):
         return key == self.first or key == self.second
+
+    def __reduce__(self):
+        # al copiar o deserializar se vuelve a la ficha de la tabla
+        return type(self), (self.first, self.second)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, _):
+        return self
+
+
+for _second in range(MAX_VALUE + 1):
+    for _first in range(MAX_VALUE + 1):
+        Domino._intern(_first, _second)
@@ -0,0 +1,50 @@
+# evaluaciones estaticas para la busqueda con profundidad limitada: como
+# Result.points, un valor positivo favorece al equipo 0 y uno negativo al 1
+
+
+def pip_difference(game):
+    points = game.remaining_points()
+    side_0, side_1 = game.rules.sides
+    difference = 0
+    for player in side_1:
+        difference += points[player]
+    for player in side_0:
+        difference -= points[player]
+    return difference
+
+
+def end_control(game):
+    # jugadores de cada equipo que pueden jugar en cada extremo
+    teams = game.rules.teams
+    control = 0
+    for value in game.ends():
+        for player, team in enumerate(teams):
+            if game.holds_value(player, value):
+                control += -1 if team else 1
+    return control
+
+
+def playable_values(game):
+    # valores distintos que cada equipo tiene en la mano
+    holds_value = game.holds_value
+    values = range(game.rules.max_value + 1)
+    difference = 0
+    for team, players in enumerate(game.rules.sides):
+        sign = -1 if team else 1
+        for value in values:
+            for player in players:
+                if holds_value(player, value):
+                    difference += sign
+                    break
+    return difference
+
+
+class linear:
+    def __init__(self, terms):
+        self._terms = tuple(terms)
+
+    def __call__(self, game):
+        return sum(weight * evaluate(game) for evaluate, weight in self._terms)
+
+
+default = linear([(pip_difference, 1), (end_control, 4), (playable_values, 2)])
@@ -1,3 +1,10 @@
+class BudgetExhaustedException(Exception):
+    '''
+    Exception to be raised when a search
+    runs out of time or nodes.
+    '''
+    pass
+
 class EmptyBoardException(Exception):
     '''
     Exception to be raised for
@@ -33,6 +40,13 @@ class NoSuchDominoException(Exception):
     '''
     pass
 
+class NoMovesException(Exception):
+    '''
+    Exception to be raised for errors
+    involving a game with no moves to undo.
+    '''
+    pass
+
 class NoSuchPlayerException(Exception):
     '''
     Exception to be raised for errors
@@ -40,6 +54,13 @@ class NoSuchPlayerException(Exception):
     '''
     pass
 
+class ProtocolException(Exception):
+    '''
+    Exception to be raised for errors
+    involving a malformed message from a client.
+    '''
+    pass
+
 class SeriesOverException(Exception):
     '''
     Exception to be raised for errors
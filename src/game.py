@@ -3,21 +3,28 @@ from domino import Domino
 from board import Board
 from hand import Hand, contains_value
 from result import Result
-from exceptions import NoSuchPlayerException, NoSuchDominoException, GameOverException, EndsMismatchException
+from exceptions import NoSuchPlayerException, NoSuchDominoException, GameOverException, EndsMismatchException, \
+    NoMovesException
 from skinny_board import SkinnyBoard
-import itertools
+from sampling import DealSampler
+from compact import hand_mask, mask_points
+from rules import DOUBLE_SIX
+import zobrist
 import random
 
 
-def _randomized_hands():
-    all_dominoes = [Domino(i, j) for i in range(7) for j in range(i, 7)]
-    random.shuffle(all_dominoes)
-    return [Hand(all_dominoes[0:7]), Hand(all_dominoes[7:14]),
-            Hand(all_dominoes[14:21]), Hand(all_dominoes[21:28])]
+def _randomized_hands(rng=random, rules=DOUBLE_SIX):
+    # devuelve las manos y el monton con lo que no se reparte
+    values = range(rules.max_value + 1)
+    all_dominoes = [Domino(i, j) for i in values for j in range(i, len(values))]
+    rng.shuffle(all_dominoes)
+    n = rules.hand_size
+    hands = [Hand(all_dominoes[n * p:n * (p + 1)]) for p in range(rules.players)]
+    return hands, all_dominoes[n * rules.players:]
 
 
-def _validate_player(player):
-    valid_players = range(4)
+def _validate_player(player, players=4):
+    valid_players = range(players)
     if player not in valid_players:
         valid_players = ', '.join(str(p) for p in valid_players)
         raise NoSuchPlayerException('{} is not a valid player. Valid players'
@@ -35,39 +42,56 @@ def _domino_hand(d, hands):
 def _remaining_points(hands):
     points = []
     for hand in hands:
-        points.append(sum(d.first + d.second for d in hand))
+        points.append(sum(d.pips for d in hand))
 
     return points
 
 
-def _validate_hands(hands, missing):
-    for h, m in zip(hands, missing):
-        for value in m:
-            if contains_value(h, value):
-                return False
-    return True
-
+def _live_dominoes(hands, left, right):
+    # un domino solo puede jugarse si alguno de sus valores llega a un
+    # extremo, y a un extremo solo llegan valores de dominos jugables
+    unplayed = [d for hand in hands for d in hand]
+    values = 1 << left | 1 << right
+    live = set()
+    changed = True
+    while changed:
+        changed = False
+        for d in unplayed:
+            if d.values & values and d not in live:
+                live.add(d)
+                values |= d.values
+                changed = True
+
+    return hand_mask(live)
+
+
+def _replay_missing(moves, starting_player, players):
+    missing = [set() for _ in range(players)]
+
+    board = SkinnyBoard()
+    player = starting_player
+    for move in moves:
+        if move is None:
+            missing[player].update([board.left_end(), board.right_end()])
+        else:
+            board.add(*move)
+        player = next_player(player, players)
+    return tuple(frozenset(m) for m in missing)
 
-def _all_possible_partitionings(elements, sizes):
-    try:
-        size = sizes[0]
-    except IndexError:
-        yield ()
-        return
-    sizes = sizes[1:]
 
-    for partition in itertools.combinations(elements, size):
-        for other_partitions in _all_possible_partitionings(elements.difference(partition), sizes):
-            yield (partition,) + other_partitions
+def next_player(player, players=4):
+    return (player + 1) % players
 
 
-def next_player(player):
-    return (player + 1) % 4
+def _highest_double(hands):
+    doubles = [d for hand in hands for d in hand if d.first == d.second]
+    return max(doubles, key=lambda d: d.first, default=None)
 
 
 class Game:
     def __init__(self, board, hands, moves, turn,
-                 valid_moves, starting_player, result):
+                 valid_moves, starting_player, result,
+                 rules=DOUBLE_SIX, boneyard=()):
         self.board = board
         self.hands = hands
         self.moves = moves
@@ -75,31 +99,73 @@ class Game:
         self.valid_moves = valid_moves
         self.starting_player = starting_player
         self.result = result
+        self.rules = rules
+        # las fichas sin repartir; con robo se roban del final
+        self.boneyard = list(boneyard)
+        self._history = []
+        # robos: (movimientos en _history al robar, jugador, fichas robadas)
+        self._draws = []
+        # se mantienen en make_move y unmake_move; aqui se calculan una vez
+        # por si la partida se crea con movimientos ya hechos
+        self._missing = _replay_missing(moves, starting_player, len(hands))
+        self._unplayed = frozenset(d for hand in hands for d in hand) | \
+            frozenset(self.boneyard)
 
     @classmethod
-    def new(cls, starting_domino=None, starting_player=0):
+    def new(cls, starting_domino=None, starting_player=0, rng=random,
+            rules=DOUBLE_SIX):
         board = Board()
 
-        hands = _randomized_hands()
+        hands, boneyard = _randomized_hands(rng, rules)
 
         moves = []
 
         result = None
 
+        if starting_domino is not None and starting_domino in boneyard:
+            # si nadie tiene la ficha de salida sale el doble mas alto
+            starting_domino = _highest_double(hands)
+
         if starting_domino is None:
-            _validate_player(starting_player)
+            _validate_player(starting_player, rules.players)
             valid_moves = tuple((d, True) for d in hands[starting_player])
             game = cls(board, hands, moves, starting_player,
-                       valid_moves, starting_player, result)
+                       valid_moves, starting_player, result, rules, boneyard)
         else:
             starting_player = _domino_hand(starting_domino, hands)
             valid_moves = ((starting_domino, True),)
             game = cls(board, hands, moves, starting_player,
-                       valid_moves, starting_player, result)
+                       valid_moves, starting_player, result, rules, boneyard)
             game.make_move(*valid_moves[0])
 
         return game
 
+    @classmethod
+    def replay(cls, record, plies=None):
+        # reconstruye la partida de un registro (ver records.py) despues de
+        # sus primeras plies fichas jugadas, o entera
+        hands = [Hand(hand) for hand in record.hands]
+        turn = record.starting_player
+        valid_moves = tuple((d, True) for d in hands[turn])
+        game = cls(Board(), hands, [], turn, valid_moves, turn, None)
+        played = [move for move in record.moves if move is not None]
+        for move in played[:plies]:
+            game.make_move(*move)
+        return game
+
+    def initial_hands(self):
+        # las manos del reparto: lo que queda mas lo que jugo cada uno
+        hands = [list(hand) for hand in self.hands]
+        draws = list(self._draws)
+        for n in range(len(self._history), 0, -1):
+            turn, _, n_moves, i, _ = self._history[n - 1]
+            # lo robado despues de la jugada n esta al final de la mano
+            while draws and draws[-1][0] == n:
+                _, player, drawn = draws.pop()
+                del hands[player][-len(drawn):]
+            hands[turn].insert(i, self.moves[n_moves][0])
+        return hands
+
     def skinny_board(self):
         self.board = SkinnyBoard.from_board(self.board)
 
@@ -129,12 +195,15 @@ class Game:
             self.hands[self.turn].draw(d, i)
             raise error
 
+        self._history.append((self.turn, self.valid_moves, len(self.moves), i,
+                              self._missing))
         self.moves.append((d, left))
+        self._unplayed = self._unplayed - {d}
 
         if not self.hands[self.turn]:
             self.valid_moves = ()
             self.result = Result(
-                self.turn, True, pow(-1, self.turn) *
+                self.turn, True, self.rules.team_sign(self.turn) *
                 sum(_remaining_points(self.hands))
             )
             return self.result
@@ -142,19 +211,23 @@ class Game:
         passes = []
         stuck = True
         for _ in self.hands:
-            self.turn = next_player(self.turn)
+            self.turn = next_player(self.turn, len(self.hands))
             self._update_valid_moves()
+            if not self.valid_moves and self.rules.draw and self.boneyard:
+                self._draw()
             if self.valid_moves:
                 self.moves.extend(passes)
+                if passes:
+                    self._pass(passes)
                 stuck = False
                 break
             else:
                 passes.append(None)
 
         if stuck:
-            player_points = _remaining_points(self.hands)
-            team_points = [player_points[0] + player_points[2],
-                           player_points[1] + player_points[3]]
+            team_points = [0, 0]
+            for player, points in enumerate(_remaining_points(self.hands)):
+                team_points[self.rules.teams[player]] += points
 
             if team_points[0] < team_points[1]:
                 self.result = Result(
@@ -167,50 +240,170 @@ class Game:
 
             return self.result
 
+    def _draw(self):
+        # se roba hasta poder jugar o vaciar el monton; lo robado puede
+        # tener cualquier valor, asi que se olvida lo que faltaba en la mano
+        drawn = []
+        while self.boneyard and not self.valid_moves:
+            d = self.boneyard.pop()
+            self.hands[self.turn].draw(d)
+            drawn.append(d)
+            self._update_valid_moves()
+        self._draws.append((len(self._history), self.turn, drawn))
+        missing = list(self._missing)
+        missing[self.turn] = frozenset()
+        self._missing = tuple(missing)
+
+    def _pass(self, passes):
+        # quien pasa no tiene ninguno de los valores de los extremos
+        ends = {self.board.left_end(), self.board.right_end()}
+        missing = list(self._missing)
+        player = self.turn
+        for _ in passes:
+            player = (player - 1) % len(self.hands)
+            missing[player] = missing[player] | ends
+        self._missing = tuple(missing)
+
+    def unmake_move(self):
+        n = len(self._history)
+        try:
+            turn, valid_moves, n_moves, i, missing = self._history.pop()
+        except IndexError:
+            raise NoMovesException(
+                'Cannot unmake a move - no moves have been made!')
+
+        while self._draws and self._draws[-1][0] == n:
+            _, player, drawn = self._draws.pop()
+            for d in reversed(drawn):
+                self.hands[player].play(d)
+                self.boneyard.append(d)
+
+        d, left = self.moves[n_moves]
+        del self.moves[n_moves:]
+        self.board.remove(d, left)
+        self.hands[turn].draw(d, i)
+        self._unplayed = self._unplayed | {d}
+        self._missing = missing
+        self.turn = turn
+        self.valid_moves = valid_moves
+        self.result = None
+
+    def remaining_dominoes(self):
+        return self.rules.remaining_dominoes(sum(len(h) for h in self.hands),
+                                             len(self.boneyard))
+
+    def remaining_points(self):
+        return _remaining_points(self.hands)
+
+    def holds_value(self, player, value):
+        return contains_value(self.hands[player], value)
+
+    def ends(self):
+        if not self.board:
+            return None, None
+        return self.board.left_end(), self.board.right_end()
+
+    def zobrist_hash(self):
+        h = self.board.zobrist_hash() ^ zobrist.TURN_KEYS[self.turn]
+        for player, hand in enumerate(self.hands):
+            h ^= zobrist.player_hash(hand.zobrist_hash(), player)
+        if self.rules.draw and self.boneyard:
+            h ^= zobrist.boneyard_hash(d.id for d in self.boneyard)
+        return h
+
     def missing_values(self):
-        missing = [set() for _ in self.hands]
+        return self._missing
 
-        board = SkinnyBoard()
-        player = self.starting_player
-        for move in self.moves:
-            if move is None:
-                missing[player].update([board.left_end(), board.right_end()])
-            else:
-                board.add(*move)
-            player = next_player(player)
-        return missing
+    def unseen_dominoes(self, player=None):
+        # las fichas que no estan en la mesa y, si se da un jugador, que
+        # tampoco estan en su mano
+        if player is None:
+            return self._unplayed
+        return self._unplayed - frozenset(self.hands[player])
 
-    def random_possible_hands(self):
+    def _deal_sampler(self):
         missing = self.missing_values()
-        other_dominoes = [d for p, h in enumerate(
-            self.hands) for d in h if p != self.turn]
-
-        while True:
-            shuffled_dominoes = (d for d in random.sample(
-                other_dominoes, len(other_dominoes)))
-            hands = []
-            for player, hand in enumerate(self.hands):
-                if player != self.turn:
-                    hand = [next(shuffled_dominoes) for _ in hand]
-                hands.append(Hand(hand))
-            if _validate_hands(hands, missing):
-                return hands
+        other_players = [p for p in range(len(self.hands)) if p != self.turn]
+        other_dominoes = [d for p in other_players for d in self.hands[p]]
+        sizes = [len(self.hands[p]) for p in other_players]
+        missing = [missing[p] for p in other_players]
+        if self.boneyard:
+            # el monton es un hueco mas, sin valores que le falten
+            other_dominoes.extend(self.boneyard)
+            sizes.append(len(self.boneyard))
+            missing.append(frozenset())
+        return other_players, DealSampler(other_dominoes, sizes, missing)
+
+    def _sampled_hands(self, other_players, slots):
+        # si hay monton va al final de la lista, en orden de robo
+        hands = [Hand(hand) for hand in self.hands]
+        for player, hand in zip(other_players, slots):
+            hands[player] = Hand(hand)
+        if self.boneyard:
+            hands.append(slots[-1])
+        return hands
+
+    def random_possible_hands(self, rng=random):
+        return self.sample_possible_hands(1, rng)[0]
+
+    def sample_possible_hands(self, n, rng=random):
+        other_players, sampler = self._deal_sampler()
+        return [self._sampled_hands(other_players, sampler.sample(rng))
+                for _ in range(n)]
 
     def all_possible_hands(self):
-        missing = self.missing_values()
-        other_dominoes = {d for p, h in enumerate(
-            self.hands) for d in h if p != self.turn}
-        other_hand_lengths = [len(h) for p, h in enumerate(
-            self.hands) if p != self.turn]
-        for possible_hands in _all_possible_partitionings(other_dominoes, other_hand_lengths):
-            possible_hands = (h for h in possible_hands)
-            hands = []
-            for player, hand in enumerate(self.hands):
-                if player != self.turn:
-                    hand = next(possible_hands)
-                hands.append(Hand(hand))
-            if _validate_hands(hands, missing):
-                yield hands
+        other_players, sampler = self._deal_sampler()
+        for slots in sampler.deals():
+            yield self._sampled_hands(other_players, slots)
+
+    def count_possible_hands(self):
+        return self._deal_sampler()[1].count()
+
+    def _deal_live(self, hands):
+        if not self.board:
+            return hand_mask(d for hand in hands for d in hand)
+        return _live_dominoes(hands, self.board.left_end(), self.board.right_end())
+
+    def weighted_possible_hands(self, possible_hands=None):
+        # dos repartos con las mismas fichas jugables en cada mano y los
+        # mismos puntos en fichas muertas por equipo tienen el mismo
+        # resultado, asi que basta con buscar uno de ellos
+        if possible_hands is None:
+            possible_hands = self.all_possible_hands()
+
+        # robando cualquier ficha puede cambiar de mano y el orden del
+        # monton importa, asi que solo se juntan repartos identicos
+        draw = self.rules.draw and bool(self.boneyard)
+        if draw:
+            live = hand_mask(self._unplayed)
+        elif not self.boneyard:
+            live = self._deal_live(self.hands)
+        else:
+            # con fichas sin repartir cada reparto deja en las manos unas
+            # distintas, y las jugables dependen de cuales
+            live = None
+
+        players = self.rules.players
+        teams = self.rules.teams
+        classes = {}
+        for hands in possible_hands:
+            if live is None:
+                deal_live = self._deal_live(hands[:players])
+            else:
+                deal_live = live
+            masks = [hand_mask(h) for h in hands[:players]]
+            dead_points = [0, 0]
+            for player, mask in enumerate(masks):
+                dead_points[teams[player]] += mask_points(mask & ~deal_live)
+            key = tuple(mask & deal_live for mask in masks) + tuple(dead_points)
+            if draw:
+                key += tuple(d.id for d in hands[players])
+            try:
+                classes[key][1] += 1
+            except KeyError:
+                classes[key] = [hands, 1]
+
+        return [tuple(c) for c in classes.values()]
 
     def __eq__(self, other):
         if not isinstance(other, type(self)):
@@ -237,14 +430,24 @@ class Game:
         result = self.result
         turn = self.turn
         starting_player = self.starting_player
-        return type(self)(board, hands, moves, turn,
-                          valid_moves, starting_player, result)
+        # sin movimientos para no recalcular lo que ya se sabe de ellos
+        game = type(self)(board, hands, [], turn,
+                          valid_moves, starting_player, result,
+                          self.rules, self.boneyard)
+        game.moves = moves
+        game._history = list(self._history)
+        game._draws = list(self._draws)
+        game._missing = self._missing
+        game._unplayed = self._unplayed
+        return game
 
     def __str__(self):
         string_list = ['Board: {}'.format(self.board)]
 
         for i, hand in enumerate(self.hands):
             string_list.append("Player {}'s hand: {}".format(i, hand))
+        if self.boneyard:
+            string_list.append('Boneyard: {} dominoes'.format(len(self.boneyard)))
 
         if self.result is None:
             string_list.append("Player {}'s turn".format(self.turn))
@@ -260,7 +463,7 @@ class Game:
                         'Player {} stuck the game and tied (0 points)!'.format(
                             self.result.player)
                     )
-                elif pow(-1, self.result.player) * self.result.points > 0:
+                elif self.rules.team_sign(self.result.player) * self.result.points > 0:
                     string_list.append(
                         'Player {} stuck the game and scored {} points!'.format(self.result.player,
                                                                                 abs(self.result.points))
@@ -1,10 +1,12 @@
 import collections.abc
 from exceptions import NoSuchDominoException
+import zobrist
 
 
 def contains_value(hand, value):
+    value = 1 << value
     for d in hand:
-        if value in d:
+        if d.values & value:
             return True
 
     return False
@@ -13,6 +15,9 @@ def contains_value(hand, value):
 class Hand(collections.abc.Sequence):
     def __init__(self, dominoes):
         self._dominoes = list(dominoes)
+        self._hash = 0
+        for d in self._dominoes:
+            self._hash ^= zobrist.domino_key(d)
 
     def play(self, d):
         try:
@@ -22,6 +27,7 @@ class Hand(collections.abc.Sequence):
                                         ' {} is not in hand!'.format(d))
 
         self._dominoes.pop(i)
+        self._hash ^= zobrist.domino_key(d)
         return i
 
     def draw(self, d, i=None):
@@ -29,6 +35,10 @@ class Hand(collections.abc.Sequence):
             self._dominoes.append(d)
         else:
             self._dominoes.insert(i, d)
+        self._hash ^= zobrist.domino_key(d)
+
+    def zobrist_hash(self):
+        return self._hash
 
     def __getitem__(self, i):
         return self._dominoes[i]
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+
+
+async def play_table(host, port, path, seats, target_score, rng, latencies):
+    # el cliente juega los asientos "human" con un movimiento al azar; la
+    # latencia va desde que envia su movimiento hasta que vuelve a tocarle
+    if path is None:
+        reader, writer = await asyncio.open_connection(host, port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        await _send(writer, {'cmd': 'new', 'seats': seats,
+                             'target_score': target_score})
+        sent = None
+        async for line in reader:
+            message = json.loads(line)
+            event = message['event']
+            if event in ('turn', 'game_over', 'series_over') and sent is not None:
+                latencies.append(time.perf_counter() - sent)
+                sent = None
+            if event == 'turn':
+                move = rng.choice(message['valid_moves'])
+                sent = time.perf_counter()
+                await _send(writer, dict(move, cmd='move'))
+            elif event == 'error':
+                raise RuntimeError(message['message'])
+            elif event == 'series_over':
+                return message['scores']
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def load_test(tables, seats, target_score=100, host='127.0.0.1',
+                    port=8765, path=None, seed=0):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        play_table(host, port, path, seats, target_score,
+                   random.Random(seed + i), latencies)
+        for i in range(tables)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Abre N mesas a la vez contra server.py y mide la latencia.')
+    parser.add_argument('-n', type=int, default=10, help='mesas simultaneas')
+    parser.add_argument('--seats', nargs='+',
+                        default=['human', 'random', 'omniscient', 'random'])
+    parser.add_argument('--target-score', type=int, default=100)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, metavar='PATH')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    latencies, elapsed = asyncio.run(load_test(
+        args.n, args.seats, args.target_score, args.host, args.port,
+        args.unix, args.seed))
+    print('{} tables, {} moves in {:.1f}s'.format(args.n, len(latencies), elapsed))
+    print('move latency p50 {:.1f} ms, p99 {:.1f} ms'.format(
+        1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,58 @@
 import collections
+import concurrent.futures
 import copy
+import math
 import random as rand
-from search import alphabeta
+import time
+import evaluation
+from search import alphabeta, iterative_deepening, parallel_alphabeta, SearchStats, \
+    heaviest_first, doubles_first
+from transposition import TranspositionTable
+from compact import CompactGame, PersistentGame, domino_index
+from book import Book
+from exceptions import NoMovesException
 
 
 def identity(game):
     return
 
 
+def _transposition_table(table_bytes):
+    if table_bytes is None:
+        return None
+    return TranspositionTable(table_bytes)
+
+
+def _solve(game, player, table, stats, evaluate, time_budget, node_budget,
+           ordering=None, tablebase=None, in_place=True):
+    if time_budget is None and node_budget is None:
+        return alphabeta(game, player=player, in_place=in_place, table=table,
+                         stats=stats, ordering=ordering, tablebase=tablebase)
+    return iterative_deepening(game, player=player, table=table, stats=stats,
+                               evaluate=evaluate, time_budget=time_budget,
+                               node_budget=node_budget, ordering=ordering,
+                               tablebase=tablebase, in_place=in_place)
+
+
+def _vote(states, player, table_bytes, evaluate=evaluation.default,
+          time_budget=None, node_budget=None, ordering=None, in_place=True):
+    # resuelve cada determinizacion y suma su peso al primer movimiento
+    table = _transposition_table(table_bytes)
+    stats = SearchStats()
+    votes = collections.Counter()
+    for state, weight in states:
+        # cada reparto empieza con sus propias tablas de killers e historia,
+        # asi el voto no depende de que repartos se buscaron antes ni de
+        # como se repartieron entre procesos
+        moves, _ = _solve(state, player, table, stats, evaluate,
+                          time_budget, node_budget, copy.deepcopy(ordering),
+                          in_place=in_place)
+        # un reparto sin variante principal no vota
+        if moves:
+            votes[moves[0]] += weight
+    return votes, stats
+
+
 class counter:
     def __init__(self, player=identity, name=None):
         self.count = 0
@@ -32,61 +77,380 @@ def reverse(game):
 
 
 def bota_gorda(game):
-    game.valid_moves = tuple(
-        sorted(game.valid_moves, key=lambda m: -(m[0].first + m[0].second)))
+    game.valid_moves = tuple(sorted(game.valid_moves, key=heaviest_first))
 
 
 def double(game):
-    game.valid_moves = tuple(
-        sorted(game.valid_moves, key=lambda m: m[0].first != m[0].second))
+    game.valid_moves = tuple(sorted(game.valid_moves, key=doubles_first))
 
 
 class omniscient:
-    def __init__(self, start_move=0, player=identity, name=None):
+    def __init__(self, start_move=0, player=identity, name=None,
+                 table_bytes=None, compact=True, workers=1,
+                 time_budget=None, node_budget=None, evaluate=evaluation.default,
+                 ordering=None, tablebase=None):
         self._start_move = start_move
         self._player = player
+        self._table_bytes = table_bytes
+        self._compact = compact
+        self._ordering = ordering
+        self._tablebase = tablebase
+        self._workers = workers
+        self._time_budget = time_budget
+        self._node_budget = node_budget
+        self._evaluate = evaluate
+        self.stats = SearchStats()
+        # la tabla y la variante principal se guardan entre turnos de la
+        # misma partida; solve_times tiene el tiempo total de cada partida
+        self._table = _transposition_table(table_bytes)
+        self._deal = None
+        self._line = []
+        self._pv = {}
+        self._value = None
+        self.solve_times = []
+        self.pv_hits = 0
         if name is None:
             self.__name__ = type(self).__name__
         else:
             self.__name__ = name
 
+    def _new_game(self, game):
+        self._deal = game.initial_hands()
+        self._line = []
+        self._pv = {}
+        self._value = None
+        if self._table is not None:
+            self._table.clear()
+        self.solve_times.append(0.0)
+
+    def _remember(self, game, moves, value):
+        # hash de cada posicion de la variante principal -> su indice
+        state = CompactGame.from_game(game)
+        self._line = moves
+        self._pv = {state.zobrist_hash(): 0}
+        for i, move in enumerate(moves[:-1]):
+            state.make_move(*move)
+            self._pv[state.zobrist_hash()] = i + 1
+        self._value = value
+
+    def _window(self, game):
+        # si el ultimo movimiento se salio de la variante principal, quien
+        # lo hizo eligio algo que no es mejor para su equipo que lo previsto
+        window = (-float('inf'), float('inf'))
+        previous = copy.deepcopy(game)
+        try:
+            previous.unmake_move()
+        except NoMovesException:
+            return window
+        if previous.zobrist_hash() not in self._pv:
+            return window
+        if previous.rules.teams[previous.turn]:
+            return (self._value - 1, window[1])
+        return (window[0], self._value + 1)
+
+    def _search(self, game):
+        if self._compact:
+            game_copy = CompactGame.from_game(game)
+        else:
+            game_copy = copy.deepcopy(game)
+            game_copy.skinny_board()
+        budgeted = self._time_budget is not None or self._node_budget is not None
+        if budgeted:
+            return _solve(game_copy, self._player, self._table, self.stats,
+                          self._evaluate, self._time_budget, self._node_budget,
+                          self._ordering, self._tablebase)
+
+        if self._workers == 1:
+            moves, value = alphabeta(game_copy, self._window(game), self._player,
+                                     table=self._table, stats=self.stats,
+                                     ordering=self._ordering,
+                                     tablebase=self._tablebase)
+        else:
+            moves, value = parallel_alphabeta(game_copy, self._workers,
+                                              player=self._player,
+                                              table_bytes=self._table_bytes)
+        # sin limites la busqueda es exacta y la variante sirve mas adelante
+        self._remember(game, moves, value)
+        return moves, value
+
     def __call__(self, game):
         if len(game.moves) < self._start_move or len(game.valid_moves) == 1:
             return
-        game_copy = copy.deepcopy(game)
-        game_copy.skinny_board()
-        moves, _ = alphabeta(game_copy, player=self._player)
+
+        start = time.perf_counter()
+        if game.initial_hands() != self._deal:
+            self._new_game(game)
+
+        i = self._pv.get(game.zobrist_hash())
+        if i is not None:
+            # las jugadas siguieron la variante principal
+            self.pv_hits += 1
+            move = self._line[i]
+        else:
+            moves, _ = self._search(game)
+            move = moves[0]
+
+        # se devuelve el movimiento tal y como aparece en el juego original
+        best_move = next(m for m in game.valid_moves if m == move)
         game.valid_moves = (
-            moves[0],) + tuple(m for m in game.valid_moves if m != moves[0])
+            best_move,) + tuple(m for m in game.valid_moves if m != best_move)
+        self.solve_times[-1] += time.perf_counter() - start
 
 
 class probabilistic_alphabeta:
-    def __init__(self, start_move=0, sample_size=float('inf'), player=identity, name=None):
+    def __init__(self, start_move=0, sample_size=float('inf'), player=identity, name=None,
+                 table_bytes=None, workers=1, chunk_size=None, seed=None,
+                 time_budget=None, node_budget=None, evaluate=evaluation.default,
+                 ordering=None, persistent=False):
         self._start_move = start_move
         self._sample_size = sample_size
+        self._ordering = ordering
+        # con PersistentGame los repartos comparten todo menos las manos y
+        # la busqueda copia estados en vez de deshacer movimientos
+        self._persistent = persistent
         self._player = player
+        self._table_bytes = table_bytes
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._time_budget = time_budget
+        self._node_budget = node_budget
+        self._evaluate = evaluate
+        # todos los repartos se generan aqui, asi el resultado
+        # no depende del numero de procesos
+        self._rng = rand if seed is None else rand.Random(seed)
+        self.stats = SearchStats()
         if name is None:
             self.__name__ = type(self).__name__
         else:
             self.__name__ = name
 
+    def _chunks(self, states):
+        if self._chunk_size is None:
+            chunk_size = math.ceil(len(states) / self._workers)
+        else:
+            chunk_size = self._chunk_size
+        return [states[i:i + chunk_size]
+                for i in range(0, len(states), chunk_size)]
+
+    def _budgets(self, n):
+        # el presupuesto es por decision y se reparte entre los repartos;
+        # el tiempo se multiplica por los procesos que buscan a la vez
+        time_budget = self._time_budget
+        if time_budget is not None:
+            time_budget = time_budget * min(self._workers, n) / n
+        node_budget = self._node_budget
+        if node_budget is not None:
+            node_budget = max(1, node_budget // n)
+        return time_budget, node_budget
+
     def __call__(self, game):
         if len(game.moves) < self._start_move or len(game.valid_moves) == 1:
             return
 
-        if self._sample_size == float('inf'):
+        # si hay menos repartos posibles que muestras, se recorren todos
+        if game.count_possible_hands() <= self._sample_size:
             hands = game.all_possible_hands()
         else:
-            hands = (game.random_possible_hands()
-                     for _ in range(self._sample_size))
+            hands = game.sample_possible_hands(self._sample_size, self._rng)
 
+        if self._persistent:
+            root = PersistentGame.from_game(game)
+            states = [(root.with_hands(h), weight)
+                      for h, weight in game.weighted_possible_hands(hands)]
+        else:
+            states = [(CompactGame.from_game(game, h), weight)
+                      for h, weight in game.weighted_possible_hands(hands)]
+        in_place = not self._persistent
+
+        time_budget, node_budget = self._budgets(len(states))
         counter = collections.Counter()
-        for h in hands:
-            game_copy = copy.deepcopy(game)
-            game_copy.hands = h
-            game_copy.skinny_board()
-            counter.update([
-                alphabeta(game_copy, player=self._player)[0][0]
-            ])
+        if self._workers == 1:
+            # la tabla se comparte entre repartos: el hash incluye las manos
+            results = [_vote(states, self._player, self._table_bytes,
+                             self._evaluate, time_budget, node_budget,
+                             self._ordering, in_place)]
+        else:
+            chunks = self._chunks(states)
+            n = len(chunks)
+            with concurrent.futures.ProcessPoolExecutor(self._workers) as executor:
+                results = list(executor.map(
+                    _vote, chunks, [self._player] * n,
+                    [self._table_bytes] * n, [self._evaluate] * n,
+                    [time_budget] * n, [node_budget] * n,
+                    [self._ordering] * n, [in_place] * n))
+
+        for votes, stats in results:
+            counter.update(votes)
+            self.stats.merge(stats)
+
         game.valid_moves = tuple(
             sorted(game.valid_moves, key=lambda m: -counter[m]))
+
+
+def _move_key(move):
+    return 2 * domino_index(move[0]) + move[1]
+
+
+class _ISNode:
+    def __init__(self, key=None, parent=None, player=None):
+        self.key = key
+        self.parent = parent
+        # jugador que hizo el movimiento que lleva a este nodo
+        self.player = player
+        self.children = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.available = 0
+
+    def ucb(self, exploration):
+        return self.reward / self.visits + \
+            exploration * math.sqrt(math.log(self.available) / self.visits)
+
+
+class ismcts:
+    '''
+    Single-observer information set Monte Carlo tree search: every
+    iteration samples a deal consistent with what the player has seen,
+    walks the shared tree with UCB restricted to the moves legal in that
+    deal, expands one node and finishes the game with random moves.
+    The subtree under the moves actually played is kept for the next
+    turn of the same game.
+    '''
+    def __init__(self, iterations=1000, time_budget=None, exploration=0.7,
+                 start_move=0, batch_size=64, seed=None, name=None):
+        self._iterations = iterations
+        self._time_budget = time_budget
+        self._exploration = exploration
+        self._start_move = start_move
+        self._batch_size = batch_size
+        self._rng = rand if seed is None else rand.Random(seed)
+        # arbol, partida y movimientos vistos en la ultima decision de cada
+        # jugador, por si la misma instancia juega en varios asientos
+        self._trees = {}
+        self.iterations_run = 0
+        self.search_time = 0.0
+        if name is None:
+            self.__name__ = type(self).__name__
+        else:
+            self.__name__ = name
+
+    def _reused_root(self, game):
+        # se baja por el arbol guardado con los movimientos jugados desde
+        # la ultima decision, si es la misma partida
+        try:
+            root, tree_game, moves = self._trees[game.turn]
+        except KeyError:
+            return _ISNode()
+
+        n = len(moves)
+        if tree_game is not game or game.moves[:n] != moves:
+            return _ISNode()
+
+        node = root
+        for move in game.moves[n:]:
+            if move is None:
+                continue
+            try:
+                node = node.children[_move_key(move)]
+            except KeyError:
+                return _ISNode()
+
+        node.parent = None
+        return node
+
+    def _iterate(self, root, state):
+        node = root
+        while state.result is None:
+            legal = {_move_key(m): m for m in state.valid_moves}
+            unexpanded = []
+            for key in legal:
+                child = node.children.get(key)
+                if child is None:
+                    unexpanded.append(key)
+                else:
+                    child.available += 1
+
+            if unexpanded:
+                key = self._rng.choice(unexpanded)
+                child = _ISNode(key, node, state.turn)
+                child.available += 1
+                node.children[key] = child
+                node = child
+                state.make_move(*legal[key])
+                break
+
+            node = max((node.children[key] for key in legal),
+                       key=lambda c: c.ucb(self._exploration))
+            state.make_move(*legal[node.key])
+
+        while state.result is None:
+            state.make_move(*self._rng.choice(state.valid_moves))
+
+        points = state.result.points
+        team_0_reward = 1.0 if points > 0 else 0.5 if points == 0 else 0.0
+        teams = state.rules.teams
+        while node is not None:
+            node.visits += 1
+            if node.player is not None:
+                node.reward += 1.0 - team_0_reward if teams[node.player] \
+                    else team_0_reward
+            node = node.parent
+
+    def __call__(self, game):
+        if len(game.moves) < self._start_move or len(game.valid_moves) == 1:
+            return
+
+        start = time.perf_counter()
+        if self._time_budget is None:
+            deadline = None
+        else:
+            deadline = start + self._time_budget
+
+        root = self._reused_root(game)
+        i = 0
+        while True:
+            for hands in game.sample_possible_hands(self._batch_size, self._rng):
+                self._iterate(root, CompactGame.from_game(game, hands))
+                i += 1
+                if deadline is None and i >= self._iterations:
+                    break
+            if deadline is None and i >= self._iterations or \
+                    deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        self.iterations_run += i
+        self.search_time += time.perf_counter() - start
+
+        visits = {key: child.visits for key, child in root.children.items()}
+        game.valid_moves = tuple(
+            sorted(game.valid_moves, key=lambda m: -visits.get(_move_key(m), 0)))
+
+        self._trees[game.turn] = (root, game, list(game.moves))
+
+
+class book:
+    def __init__(self, player, opening_book, min_votes=1, name=None):
+        # opening_book puede ser un Book o la ruta de un fichero
+        if not isinstance(opening_book, Book):
+            opening_book = Book.load(opening_book)
+        self._player = player
+        self._book = opening_book
+        self._min_votes = min_votes
+        self.hits = 0
+        self.misses = 0
+        if name is None:
+            self.__name__ = type(self).__name__
+        else:
+            self.__name__ = name
+
+    def __call__(self, game):
+        move = self._book.lookup(game, self._min_votes)
+        if move is None or move not in game.valid_moves:
+            self.misses += 1
+            self._player(game)
+            return
+
+        self.hits += 1
+        best_move = next(m for m in game.valid_moves if m == move)
+        game.valid_moves = (
+            best_move,) + tuple(m for m in game.valid_moves if m != best_move)
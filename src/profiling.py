@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+
+# Resuelve una posicion sembrada con alphabeta y muestra sus estadisticas.
+# Se puede perfilar con cProfile (--cprofile) o con herramientas externas:
+#   pyinstrument src/profiling.py --moves-played 6
+
+import argparse
+import cProfile
+import pstats
+from benchmark import seeded_game
+from compact import CompactGame
+from search import MoveOrdering, instrumented_alphabeta
+from transposition import TranspositionTable
+
+
+def solve(seed=0, moves_played=4, compact=True, in_place=True,
+          table_bytes=None, ordering=False, timings=True):
+    game = seeded_game(seed, moves_played)
+    if compact:
+        game = CompactGame.from_game(game)
+    else:
+        game.skinny_board()
+    table = None if table_bytes is None else TranspositionTable(table_bytes)
+    return instrumented_alphabeta(
+        game, timings=timings, in_place=in_place, table=table,
+        ordering=MoveOrdering() if ordering else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perfila alphabeta.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--moves-played', type=int, default=4)
+    parser.add_argument('--game', action='store_true',
+                        help='usa Game en vez de CompactGame')
+    parser.add_argument('--copy', action='store_true',
+                        help='genera los hijos con deepcopy en vez de deshacer')
+    parser.add_argument('--table-bytes', type=int, default=None)
+    parser.add_argument('--ordering', action='store_true')
+    parser.add_argument('--no-timings', action='store_true',
+                        help='sin medir tiempos, que tambien cuestan')
+    parser.add_argument('--cprofile', metavar='PATH', nargs='?', const='-',
+                        help='ejecuta con cProfile; guarda los datos en PATH'
+                             ' o muestra las funciones mas costosas')
+    args = parser.parse_args()
+
+    kwargs = dict(seed=args.seed, moves_played=args.moves_played,
+                  compact=not args.game, in_place=not args.copy,
+                  table_bytes=args.table_bytes, ordering=args.ordering,
+                  timings=not args.no_timings)
+    if args.cprofile is None:
+        moves, value, stats = solve(**kwargs)
+    else:
+        profiler = cProfile.Profile()
+        moves, value, stats = profiler.runcall(solve, **kwargs)
+        if args.cprofile == '-':
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        else:
+            profiler.dump_stats(args.cprofile)
+
+    print('value {} moves {}'.format(value, moves))
+    print(stats.report())
+
+
+if __name__ == '__main__':
+    main()
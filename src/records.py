@@ -0,0 +1,171 @@
+import collections
+import mmap
+import os
+import random
+import struct
+from compact import DOMINOES
+from game import Game
+from result import Result
+from rules import DOUBLE_SIX
+from series import Series
+
+# Fichero de partidas: la magia y despues un registro por partida,
+#   cabecera: reparto (28 indices de 5 bits, 7 por mano en su orden),
+#             jugador inicial, resultado (jugador o 0xff si no hay,
+#             si se gano), puntos y numero de movimientos
+#   movimientos: un byte cada uno, indice << 1 | izquierda o PASS
+# Los registros solo se añaden al final; uno a medias (si se corto la
+# escritura) se ignora al leer.
+
+MAGIC = b'DGR1'
+HEADER = struct.Struct('<18sBBBhH')
+DEAL_BYTES = 18
+PASS = 0x80
+NO_RESULT = 0xff
+
+# partida guardada: manos iniciales, movimientos (con None al pasar) y Result
+Record = collections.namedtuple('Record', ['hands', 'starting_player', 'moves', 'result'])
+
+
+def encode(game):
+    if game.rules != DOUBLE_SIX:
+        raise ValueError('Only double-six games with four players can be'
+                         ' recorded, not {}'.format(game.rules))
+    hands = game.initial_hands()
+    deal = 0
+    for k, d in enumerate(d for hand in hands for d in hand):
+        deal |= d.id << 5 * k
+
+    moves = bytes(PASS if move is None else move[0].id << 1 | move[1]
+                  for move in game.moves)
+    if game.result is None:
+        result = (NO_RESULT, 0, 0)
+    else:
+        result = (game.result.player, game.result.won, game.result.points)
+    return HEADER.pack(deal.to_bytes(DEAL_BYTES, 'little'), game.starting_player,
+                       *result, len(moves)) + moves
+
+
+def decode(buffer, offset=0):
+    # devuelve el registro y donde empieza el siguiente
+    deal, starting_player, player, won, points, n = HEADER.unpack_from(buffer, offset)
+    offset += HEADER.size
+    deal = int.from_bytes(deal, 'little')
+    dominoes = [DOMINOES[deal >> 5 * k & 0x1f] for k in range(28)]
+    hands = [dominoes[7 * p:7 * (p + 1)] for p in range(4)]
+
+    moves = [None if code == PASS else (DOMINOES[code >> 1], bool(code & 1))
+             for code in buffer[offset:offset + n]]
+    result = None if player == NO_RESULT else Result(player, bool(won), points)
+    return Record(hands, starting_player, moves, result), offset + n
+
+
+class RecordWriter:
+    '''
+    Append-only writer of game records. Opening an existing file keeps
+    its records and adds new ones after them.
+    '''
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        if not self._file.tell():
+            self._file.write(MAGIC)
+
+    def write(self, game):
+        self._file.write(encode(game))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class RecordReader:
+    '''
+    Iterates over the records of a file through a memory map, decoding
+    one record at a time.
+    '''
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b''
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a game record file'.format(path))
+
+    def __iter__(self):
+        offset = len(MAGIC)
+        end = len(self._map)
+        while offset + HEADER.size <= end:
+            n = HEADER.unpack_from(self._map, offset)[-1]
+            if offset + HEADER.size + n > end:
+                break
+            record, offset = decode(self._map, offset)
+            yield record
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+# Instantanea de una serie: magia, puntos objetivo y de cada equipo,
+# estado del generador aleatorio y las partidas como registros.
+SNAPSHOT_MAGIC = b'DSS1'
+SNAPSHOT_HEADER = struct.Struct('<IiiH')
+RNG_STATE = struct.Struct('<625I?d')
+
+
+def snapshot(series):
+    _, state, gauss_next = series._rng.getstate()
+    data = [SNAPSHOT_MAGIC,
+            SNAPSHOT_HEADER.pack(series.target_score, *series.scores, len(series.games)),
+            RNG_STATE.pack(*state, gauss_next is not None, gauss_next or 0.0)]
+    data.extend(encode(game) for game in series.games)
+    return b''.join(data)
+
+
+def restore(data):
+    # la serie sigue con un random.Random propio en el mismo estado, aunque
+    # la original usara el modulo random
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError('not a series snapshot')
+    offset = len(SNAPSHOT_MAGIC)
+    target_score, score_0, score_1, n = SNAPSHOT_HEADER.unpack_from(data, offset)
+    offset += SNAPSHOT_HEADER.size
+    *state, has_gauss, gauss_next = RNG_STATE.unpack_from(data, offset)
+    offset += RNG_STATE.size
+
+    rng = random.Random()
+    rng.setstate((3, tuple(state), gauss_next if has_gauss else None))
+    games = []
+    for _ in range(n):
+        record, offset = decode(data, offset)
+        games.append(Game.replay(record))
+    return Series.resume(games, [score_0, score_1], target_score, rng)
+
+
+def save_snapshot(series, path):
+    # se escribe aparte y se renombra, asi nunca queda una instantanea a medias
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(snapshot(series))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        return restore(f.read())
@@ -0,0 +1,94 @@
+from domino import Domino, MAX_VALUE
+
+# fichas por mano si no se dice otra cosa
+HAND_SIZES = {6: 7, 9: 10, 12: 12}
+
+
+class Rules:
+    '''
+    Domino set, seats and dealing of a game: dominoes from [0|0] to
+    [max_value|max_value], hand_size of them dealt to each of 2-4
+    players, and the rest left in the boneyard. With draw=True a player
+    who cannot play draws from the boneyard until they can (or it runs
+    out) instead of passing. Seats play as two sides given by teams:
+    partners across the table with four players, one against two with
+    three. A stuck game is won by the side with fewer pips in hand.
+    '''
+    def __init__(self, max_value=6, players=4, hand_size=None, draw=False,
+                 teams=None):
+        if not 0 < max_value <= MAX_VALUE:
+            raise ValueError('max_value must be between 1 and {}'.format(MAX_VALUE))
+        if players not in (2, 3, 4):
+            raise ValueError('{} players are not supported - there can be'
+                             ' 2, 3 or 4'.format(players))
+
+        self.max_value = max_value
+        self.players = players
+        # en orden de indice, el mismo que usan compact y zobrist
+        self.dominoes = tuple(Domino(low, high) for high in range(max_value + 1)
+                              for low in range(high + 1))
+
+        if hand_size is None:
+            hand_size = HAND_SIZES.get(max_value, len(self.dominoes) // 4)
+        if not 0 < hand_size * players <= len(self.dominoes):
+            raise ValueError('Cannot deal {} hands of {} dominoes from a set'
+                             ' of {}'.format(players, hand_size, len(self.dominoes)))
+        self.hand_size = hand_size
+        self.draw = draw
+
+        if teams is None:
+            teams = (0, 1, 1) if players == 3 else tuple(p % 2 for p in range(players))
+        teams = tuple(teams)
+        if len(teams) != players or set(teams) != {0, 1}:
+            raise ValueError('teams must give side 0 or 1 to each of the {}'
+                             ' players, and both sides need a player'.format(players))
+        self.teams = teams
+        # los jugadores de cada equipo
+        self.sides = tuple(tuple(p for p in range(players) if teams[p] == team)
+                           for team in (0, 1))
+
+    def team_sign(self, player):
+        # el signo de Result.points cuando puntua el equipo de player
+        return -1 if self.teams[player] else 1
+
+    def boneyard_size(self):
+        return len(self.dominoes) - self.players * self.hand_size
+
+    def remaining_dominoes(self, in_hands, in_boneyard):
+        # las fichas que aun pueden jugarse: con robo, tambien las del monton
+        if self.draw:
+            return in_hands + in_boneyard
+        return in_hands
+
+    def _key(self):
+        return (self.max_value, self.players, self.hand_size, self.draw, self.teams)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, type(self)):
+            return False
+
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        return 'double-{}, {} players, {} dominoes each{}'.format(
+            self.max_value, self.players, self.hand_size,
+            ', drawing from the boneyard' if self.draw else '')
+
+    def __repr__(self):
+        return str(self)
+
+
+DOUBLE_SIX = Rules()
+DOUBLE_NINE = Rules(9)
+DOUBLE_TWELVE = Rules(12)
+
+# para las opciones de linea de comandos
+SETS = {'double-six': 6, 'double-nine': 9, 'double-twelve': 12}
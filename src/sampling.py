@@ -0,0 +1,86 @@
+import random
+
+
+class DealSampler:
+    '''
+    Uniform sampler and enumerator over the ways of dealing a set of
+    dominoes into slots of fixed size, where each slot may be known to
+    lack some values.
+
+    The number of valid deals that complete a partial deal only depends
+    on how many dominoes have been placed and how much room is left in
+    each slot, so those counts are memoized and each domino is placed
+    with probability proportional to the completions it leaves.
+    '''
+    def __init__(self, dominoes, sizes, missing):
+        self.dominoes = list(dominoes)
+        self.sizes = tuple(sizes)
+        missing = [sum(1 << value for value in m) for m in missing]
+        self._allowed = [
+            tuple(s for s, m in enumerate(missing) if not d.values & m)
+            for d in self.dominoes
+        ]
+        self._counts = {}
+
+    def _count(self, i, room):
+        try:
+            return self._counts[i, room]
+        except KeyError:
+            pass
+
+        if i == len(self.dominoes):
+            count = int(not any(room))
+        else:
+            count = 0
+            for s in self._allowed[i]:
+                if room[s]:
+                    count += self._count(i + 1, _take(room, s))
+
+        self._counts[i, room] = count
+        return count
+
+    def count(self):
+        return self._count(0, self.sizes)
+
+    def sample(self, rng=random):
+        room = self.sizes
+        slots = [[] for _ in self.sizes]
+        for i, d in enumerate(self.dominoes):
+            choice = rng.randrange(self._count(i, room))
+            for s in self._allowed[i]:
+                if not room[s]:
+                    continue
+                choice -= self._count(i + 1, _take(room, s))
+                if choice < 0:
+                    break
+            slots[s].append(d)
+            room = _take(room, s)
+
+        for slot in slots:
+            rng.shuffle(slot)
+        return slots
+
+    def deals(self):
+        # solo se entra en ramas con alguna forma valida de completarse
+        slots = [[] for _ in self.sizes]
+
+        def _deals(i, room):
+            if i == len(self.dominoes):
+                yield [list(slot) for slot in slots]
+                return
+
+            for s in self._allowed[i]:
+                if not room[s]:
+                    continue
+                next_room = _take(room, s)
+                if not self._count(i + 1, next_room):
+                    continue
+                slots[s].append(self.dominoes[i])
+                yield from _deals(i + 1, next_room)
+                slots[s].pop()
+
+        return _deals(0, self.sizes)
+
+
+def _take(room, s):
+    return room[:s] + (room[s] - 1,) + room[s + 1:]
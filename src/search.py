@@ -1,9 +1,137 @@
+import collections
+import concurrent.futures
+import contextlib
 import copy
 import operator
+import time
+import evaluation
+from exceptions import BudgetExhaustedException
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
 
 def identity(game):
     return
 
+
+class SearchStats:
+    '''
+    Counters filled by alphabeta when it is given a stats object. With
+    timings=True it also measures the time spent generating children
+    (make_moves), in make_move and unmake_move, and in deepcopy.
+    '''
+    def __init__(self, timings=False):
+        self.nodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.tb_hits = 0
+        self.max_depth = 0
+        # cortes alpha-beta por profundidad y nodos por numero de hijos
+        self.cutoffs = collections.Counter()
+        self.branching = collections.Counter()
+        self.timings = timings
+        self.make_moves_time = 0.0
+        self.make_move_time = 0.0
+        self.copy_time = 0.0
+
+    def merge(self, other):
+        self.nodes += other.nodes
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+        self.tt_cutoffs += other.tt_cutoffs
+        self.tb_hits += other.tb_hits
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.cutoffs.update(other.cutoffs)
+        self.branching.update(other.branching)
+        self.make_moves_time += other.make_moves_time
+        self.make_move_time += other.make_move_time
+        self.copy_time += other.copy_time
+
+    def tt_hit_rate(self):
+        if not self.tt_probes:
+            return 0.0
+        return self.tt_hits / self.tt_probes
+
+    def mean_branching(self):
+        interior = sum(self.branching.values())
+        if not interior:
+            return 0.0
+        return sum(b * n for b, n in self.branching.items()) / interior
+
+    def report(self):
+        lines = [str(self),
+                 'max depth: {}, mean branching factor: {:.2f}'.format(
+                     self.max_depth, self.mean_branching())]
+        lines.append('cutoffs by depth:')
+        for depth, n in sorted(self.cutoffs.items()):
+            lines.append('  {:>2}: {}'.format(depth, n))
+        lines.append('nodes by branching factor:')
+        for b, n in sorted(self.branching.items()):
+            lines.append('  {:>2}: {}'.format(b, n))
+        if self.timings:
+            lines.append('make_moves: {:.3f}s (make_move: {:.3f}s,'
+                         ' deepcopy: {:.3f}s)'.format(self.make_moves_time,
+                                                      self.make_move_time,
+                                                      self.copy_time))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return ('nodes: {}, tt probes: {}, tt hits: {} ({:.1%}),'
+                ' tt cutoffs: {}, tablebase hits: {}'.format(
+                    self.nodes, self.tt_probes, self.tt_hits,
+                    self.tt_hit_rate(), self.tt_cutoffs, self.tb_hits))
+
+    def __repr__(self):
+        return str(self)
+
+
+def heaviest_first(move):
+    return -move[0].pips
+
+
+def doubles_first(move):
+    return move[0].first != move[0].second
+
+
+class MoveOrdering:
+    '''
+    Orders the valid moves of each node before alphabeta expands them:
+    the transposition table move first, then killer moves for that ply,
+    then by history score and finally by the given static keys. Killer
+    and history tables are kept between sibling nodes, searches and
+    iterative deepening iterations.
+    '''
+    def __init__(self, keys=(doubles_first, heaviest_first), tt_move=True,
+                 killers=True, history=True):
+        self._keys = tuple(keys)
+        self._tt_move = tt_move
+        self._killers = {} if killers else None
+        self._history = collections.Counter() if history else None
+
+    def order(self, game, level, tt_move=None):
+        if not self._tt_move:
+            tt_move = None
+        killers = () if self._killers is None else self._killers.get(level, ())
+        history = self._history
+
+        def key(move):
+            k = (move != tt_move, move not in killers)
+            if history is not None:
+                k += (-history[move],)
+            return k + tuple(f(move) for f in self._keys)
+
+        game.valid_moves = tuple(sorted(game.valid_moves, key=key))
+
+    def cutoff(self, move, level, draft):
+        if self._killers is not None:
+            killers = self._killers.setdefault(level, [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+        if self._history is not None:
+            self._history[move] += draft * draft
+
+
 def make_moves(game, player=identity):
     if game.result is not None:
         return
@@ -17,12 +145,150 @@ def make_moves(game, player=identity):
     yield move, game
 
 
+def make_moves_in_place(game, player=identity):
+    # cada movimiento se deshace al avanzar (o al cerrar el generador),
+    # por lo que el juego queda como estaba al terminar la iteracion
+    if game.result is not None:
+        return
+    player(game)
+    for move in game.valid_moves:
+        game.make_move(*move)
+        try:
+            yield move, game
+        finally:
+            game.unmake_move()
+
+
+def _timed_make_moves(game, player, stats):
+    # make_moves midiendo deepcopy y make_move por separado
+    if game.result is not None:
+        return
+    player(game)
+    for move in game.valid_moves[:-1]:
+        start = time.perf_counter()
+        new_game = copy.deepcopy(game)
+        copied = time.perf_counter()
+        new_game.make_move(*move)
+        stats.copy_time += copied - start
+        stats.make_move_time += time.perf_counter() - copied
+        yield move, new_game
+    move = game.valid_moves[-1]
+    start = time.perf_counter()
+    game.make_move(*move)
+    stats.make_move_time += time.perf_counter() - start
+    yield move, game
+
+
+def _timed_make_moves_in_place(game, player, stats):
+    if game.result is not None:
+        return
+    player(game)
+    for move in game.valid_moves:
+        start = time.perf_counter()
+        game.make_move(*move)
+        stats.make_move_time += time.perf_counter() - start
+        try:
+            yield move, game
+        finally:
+            start = time.perf_counter()
+            game.unmake_move()
+            stats.make_move_time += time.perf_counter() - start
+
+
+def _timed_children(children, stats):
+    # tiempo total dentro del generador de hijos
+    while True:
+        start = time.perf_counter()
+        try:
+            child = next(children)
+        except StopIteration:
+            return
+        finally:
+            stats.make_moves_time += time.perf_counter() - start
+        try:
+            yield child
+        except GeneratorExit:
+            start = time.perf_counter()
+            children.close()
+            stats.make_moves_time += time.perf_counter() - start
+            raise
+
+
+class Budget:
+    def __init__(self, time_budget=None, node_budget=None):
+        if time_budget is None:
+            self.deadline = None
+        else:
+            self.deadline = time.perf_counter() + time_budget
+        self.node_budget = node_budget
+        self.nodes = 0
+
+    def spend(self):
+        self.nodes += 1
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise BudgetExhaustedException(
+                'Search stopped after {} nodes!'.format(self.node_budget))
+        # consultar el reloj en cada nodo es caro
+        if self.deadline is not None and not self.nodes % 64 and \
+                time.perf_counter() > self.deadline:
+            raise BudgetExhaustedException('Search ran out of time!')
+
+
 def alphabeta(game, alpha_beta=(-float('inf'), float('inf')),
-              player=identity):
+              player=identity, in_place=True, table=None, stats=None,
+              depth=None, evaluate=evaluation.default, budget=None,
+              ordering=None, tablebase=None, ply=0):
+    if stats is not None:
+        stats.nodes += 1
+        if ply > stats.max_depth:
+            stats.max_depth = ply
+
+    if budget is not None:
+        budget.spend()
+
     if game.result is not None:
         return [], game.result.points
 
-    if game.turn % 2:
+    if tablebase is not None:
+        # el valor de la tabla es exacto, sea cual sea la profundidad
+        entry = tablebase.probe(game)
+        if entry is not None:
+            if stats is not None:
+                stats.tb_hits += 1
+            return entry
+
+    if depth == 0:
+        return [], evaluate(game)
+
+    tt_move = None
+    if table is not None or ordering is not None:
+        remaining = game.remaining_dominoes()
+        # con profundidad mayor que las fichas que quedan la busqueda es exacta
+        draft = remaining if depth is None else min(depth, remaining)
+
+    if table is not None:
+        key = game.zobrist_hash()
+        original_alpha_beta = alpha_beta
+        entry = table.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+        if entry is not None:
+            tt_move = entry.moves[0]
+        if entry is not None and entry.depth >= draft:
+            if stats is not None:
+                stats.tt_hits += 1
+            if entry.flag == EXACT:
+                return list(entry.moves), entry.value
+            elif entry.flag == LOWER:
+                alpha_beta = (max(alpha_beta[0], entry.value), alpha_beta[1])
+            else:
+                alpha_beta = (alpha_beta[0], min(alpha_beta[1], entry.value))
+            if alpha_beta[1] <= alpha_beta[0]:
+                if stats is not None:
+                    stats.tt_cutoffs += 1
+                return list(entry.moves), entry.value
+
+    if game.rules.teams[game.turn]:
         # minimizando
         best_value = float('inf')
         op = operator.lt
@@ -33,16 +299,138 @@ def alphabeta(game, alpha_beta=(-float('inf'), float('inf')),
         op = operator.gt
         def update(ab, v): return (max(ab[0], v), ab[1])
 
+    if ordering is None:
+        order = player
+    else:
+        # cada ficha jugada reduce las que quedan en uno, asi que sirven
+        # para identificar el nivel del arbol en las tablas de killers
+        player(game)
+        ordering.order(game, remaining, tt_move)
+        order = identity
+
+    if stats is None or not stats.timings:
+        if in_place:
+            children = make_moves_in_place(game, order)
+        else:
+            children = make_moves(game, order)
+    elif in_place:
+        children = _timed_children(
+            _timed_make_moves_in_place(game, order, stats), stats)
+    else:
+        children = _timed_children(_timed_make_moves(game, order, stats), stats)
+
+    if stats is not None:
+        stats.branching[len(game.valid_moves)] += 1
+
+    child_depth = None if depth is None else depth - 1
+
     # recursividad
-    for move, new_game in make_moves(game, player):
-        moves, value = alphabeta(new_game, alpha_beta, player)
-        if op(value, best_value):
-            best_value = value
-            best_moves = moves
-            best_moves.insert(0, move)
-            alpha_beta = update(alpha_beta, best_value)
-            if alpha_beta[1] <= alpha_beta[0]:
-                # alpha-beta apagado
-                break
+    with contextlib.closing(children):
+        for move, new_game in children:
+            moves, value = alphabeta(new_game, alpha_beta, player,
+                                     in_place, table, stats,
+                                     child_depth, evaluate, budget, ordering,
+                                     tablebase, ply + 1)
+            if op(value, best_value):
+                best_value = value
+                best_moves = moves
+                best_moves.insert(0, move)
+                alpha_beta = update(alpha_beta, best_value)
+                if alpha_beta[1] <= alpha_beta[0]:
+                    # alpha-beta apagado
+                    if stats is not None:
+                        stats.cutoffs[ply] += 1
+                    if ordering is not None:
+                        ordering.cutoff(move, remaining, draft)
+                    break
+
+    if table is not None:
+        if best_value <= original_alpha_beta[0]:
+            flag = UPPER
+        elif best_value >= original_alpha_beta[1]:
+            flag = LOWER
+        else:
+            flag = EXACT
+        table.store(key, draft, flag, best_value, best_moves)
+
+    return best_moves, best_value
+
+
+def instrumented_alphabeta(game, timings=True, **kwargs):
+    # alphabeta con estadisticas: devuelve (moves, value, stats)
+    stats = SearchStats(timings)
+    moves, value = alphabeta(game, stats=stats, **kwargs)
+    return moves, value, stats
+
+
+def iterative_deepening(game, player=identity, table=None, stats=None,
+                        evaluate=evaluation.default, time_budget=None,
+                        node_budget=None, ordering=None, tablebase=None,
+                        in_place=True):
+    budget = Budget(time_budget, node_budget)
+    remaining = game.remaining_dominoes()
+
+    def root():
+        # copiando, make_moves juega el ultimo hijo sobre el juego que
+        # recibe, asi que cada iteracion busca desde su propia copia
+        return game if in_place else copy.deepcopy(game)
+
+    # la primera iteracion no tiene limite para tener siempre un movimiento
+    depth = 1
+    best = alphabeta(root(), player=player, in_place=in_place, table=table,
+                     stats=stats, depth=depth, evaluate=evaluate,
+                     ordering=ordering, tablebase=tablebase)
+
+    while depth < remaining:
+        depth += 1
+        try:
+            best = alphabeta(root(), player=player, in_place=in_place,
+                             table=table, stats=stats, depth=depth,
+                             evaluate=evaluate, budget=budget,
+                             ordering=ordering, tablebase=tablebase)
+        except BudgetExhaustedException:
+            break
+
+    return best
+
+
+def _search_root_move(game, move, alpha_beta, player, table_bytes):
+    table = None if table_bytes is None else TranspositionTable(table_bytes)
+    game.make_move(*move)
+    moves, value = alphabeta(game, alpha_beta, player, table=table)
+    return [move] + moves, value
+
+
+def parallel_alphabeta(game, workers, player=identity, table_bytes=None):
+    if game.result is not None:
+        return [], game.result.points
+
+    player(game)
+    root_moves = game.valid_moves
+
+    if game.rules.teams[game.turn]:
+        op = operator.lt
+        def window(v): return (-float('inf'), v)
+    else:
+        op = operator.gt
+        def window(v): return (v, float('inf'))
+
+    # el primer hermano se busca solo (young brothers wait) y su valor
+    # acota la ventana con la que se reparten los demas entre los procesos
+    best_moves, best_value = _search_root_move(
+        copy.deepcopy(game), root_moves[0],
+        (-float('inf'), float('inf')), player, table_bytes)
+    if len(root_moves) == 1:
+        return best_moves, best_value
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_search_root_move, game, move,
+                                   window(best_value), player, table_bytes)
+                   for move in root_moves[1:]]
+        # en orden, para elegir el mismo movimiento que alphabeta en empates
+        for future in futures:
+            moves, value = future.result()
+            if op(value, best_value):
+                best_moves, best_value = moves, value
 
     return best_moves, best_value
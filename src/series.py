@@ -1,15 +1,32 @@
+import random
 from domino import Domino
 from game import Game, next_player
+from rules import DOUBLE_SIX
 from exceptions import SeriesOverException, GameInProgressException
 class Series:
-    def __init__(self, target_score=200, starting_domino=None):
+    def __init__(self, target_score=200, starting_domino=None, rng=random,
+                 rules=DOUBLE_SIX):
         if starting_domino is None:
-            starting_domino = Domino(6, 6)
+            starting_domino = Domino(rules.max_value, rules.max_value)
 
-        self.games = [Game.new(starting_domino=starting_domino)]
+        self._rng = rng
+        self.rules = rules
+        self.games = [Game.new(starting_domino=starting_domino, rng=rng,
+                               rules=rules)]
         self.scores = [0, 0]
         self.target_score = target_score
 
+    @classmethod
+    def resume(cls, games, scores, target_score, rng=random):
+        # una serie a medias, por ejemplo restaurada de una instantanea
+        series = cls.__new__(cls)
+        series._rng = rng
+        series.rules = games[-1].rules
+        series.games = games
+        series.scores = scores
+        series.target_score = target_score
+        return series
+
     def is_over(self):
         return max(self.scores) >= self.target_score
 
@@ -30,13 +47,14 @@ class Series:
             self.scores[1] -= result.points
         if self.is_over():
             return
-        if result.won or pow(-1, result.player) * result.points > 0:
+        if result.won or self.rules.team_sign(result.player) * result.points > 0:
             starting_player = result.player
         elif not result.points:
             starting_player = self.games[-1].starting_player
         else:
-            starting_player = next_player(result.player)
-        self.games.append(Game.new(starting_player=starting_player))
+            starting_player = next_player(result.player, self.rules.players)
+        self.games.append(Game.new(starting_player=starting_player, rng=self._rng,
+                                   rules=self.rules))
         return self.games[-1]
 
     def __str__(self):
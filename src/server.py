@@ -0,0 +1,271 @@
+#! /usr/bin/env python
+
+import argparse
+import asyncio
+import concurrent.futures
+import copy
+import json
+import os
+from domino import Domino
+from exceptions import ProtocolException
+from rules import Rules
+from series import Series
+from simulation import player_by_name
+
+# Protocolo de lineas JSON, un mensaje por linea. El cliente abre una
+# mesa con
+#   {"cmd": "new", "seats": ["human", "random", "omniscient", "random"],
+#    "target_score": 100}
+# (de 2 a 4 asientos; "max_value": 9 y "draw": true cambian el juego)
+# y en los asientos "human" juega el cliente: cuando le toca recibe un
+# evento "turn" y contesta con
+#   {"cmd": "move", "domino": [6, 4], "left": true}
+# El servidor envia "table", "turn", "moved", "game_over", "series_over"
+# y "error".
+
+HUMAN = 'human'
+# los jugadores de players.py que se pueden sentar en una mesa: se crean
+# sin argumentos y solo deciden sobre la partida que reciben
+STRATEGIES = ('random', 'reverse', 'bota_gorda', 'double', 'omniscient',
+              'probabilistic_alphabeta', 'ismcts')
+
+
+def _decide(player, game):
+    # se ejecuta en el pool: los jugadores ordenan valid_moves
+    player(game)
+    return game.valid_moves[0]
+
+
+def _move_json(move):
+    d, left = move
+    return {'domino': [d.first, d.second], 'left': left}
+
+
+def _state_json(game, series):
+    return {
+        'board': str(game.board),
+        'turn': game.turn,
+        'hand': [[d.first, d.second] for d in game.hands[game.turn]],
+        'hand_sizes': [len(hand) for hand in game.hands],
+        'boneyard_size': len(game.boneyard),
+        'valid_moves': [_move_json(m) for m in game.valid_moves],
+        'scores': list(series.scores),
+    }
+
+
+def _parse_move(message, game):
+    try:
+        a, b = message['domino']
+        move = (Domino(int(a), int(b)), bool(message['left']))
+    except (KeyError, TypeError, ValueError):
+        raise ProtocolException('expected {"cmd": "move", "domino": [a, b], "left": bool}')
+    for valid_move in game.valid_moves:
+        if valid_move == move:
+            return valid_move
+    raise ProtocolException('{} on the {} end is not a valid move'.format(
+        move[0], 'left' if move[1] else 'right'))
+
+
+class Table:
+    '''
+    A series played over one connection. Messages to the client go
+    through a bounded queue drained by the connection's writer, so a
+    client that stops reading only stalls its own table.
+    '''
+    def __init__(self, table_id, server, seats, target_score, outbox, commands,
+                 rules=None):
+        self.id = table_id
+        self._server = server
+        for name in seats:
+            if name != HUMAN and name not in STRATEGIES:
+                raise ProtocolException('{!r} is not a seat - expected {!r} or one'
+                                        ' of {}'.format(name, HUMAN, ', '.join(STRATEGIES)))
+        self._seats = [None if name == HUMAN else player_by_name(name)
+                       for name in seats]
+        if rules is None:
+            rules = Rules(players=len(seats))
+        self.series = Series(target_score=target_score, rules=rules)
+        self._outbox = outbox
+        self._commands = commands
+
+    async def _send(self, event, **fields):
+        fields['event'] = event
+        await self._outbox.put(fields)
+
+    async def _human_move(self, game):
+        await self._send('turn', **_state_json(game, self.series))
+        while True:
+            message = await self._commands.get()
+            if message is None:
+                raise ConnectionResetError
+            if message.get('cmd') != 'move':
+                await self._send('error', message='expected a move')
+                continue
+            try:
+                return _parse_move(message, game)
+            except ProtocolException as error:
+                await self._send('error', message=str(error))
+
+    async def play(self):
+        await self._send('table', id=self.id,
+                         starting_player=self.series.games[0].starting_player)
+        game = self.series.games[0]
+        while game is not None:
+            while game.result is None:
+                player = self._seats[game.turn]
+                turn = game.turn
+                if player is None:
+                    move = await self._human_move(game)
+                else:
+                    move = await self._server.decide(player, game)
+                game.make_move(*move)
+                await self._send('moved', player=turn, **_move_json(move))
+
+            await self._send('game_over', player=game.result.player,
+                             won=game.result.won, points=game.result.points)
+            game = self.series.next_game()
+
+        await self._send('series_over', scores=list(self.series.scores))
+
+
+class Server:
+    def __init__(self, workers=None, executor='process', queue_size=64,
+                 pending_decisions=None):
+        if executor == 'process':
+            self._executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        # el pool no acepta mas decisiones de las que puede empezar pronto;
+        # el resto de mesas espera aqui sin bloquear el bucle
+        if pending_decisions is None:
+            pending_decisions = 2 * (workers or os.cpu_count() or 1)
+        self._slots = asyncio.Semaphore(pending_decisions)
+        self._queue_size = queue_size
+        self._tables = 0
+        self.active_tables = 0
+
+    async def decide(self, player, game):
+        if len(game.valid_moves) == 1:
+            return game.valid_moves[0]
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            move = await loop.run_in_executor(
+                self._executor, _decide, player, copy.deepcopy(game))
+        # el movimiento del juego original, no la copia que devuelve el pool
+        return next(m for m in game.valid_moves if m == move)
+
+    async def _read(self, reader, commands, outbox):
+        try:
+            async for line in reader:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    await outbox.put({'event': 'error',
+                                      'message': 'expected a JSON object'})
+                    continue
+                # si la mesa no consume, se deja de leer del socket
+                await commands.put(message)
+        finally:
+            await commands.put(None)
+
+    async def _write(self, writer, outbox):
+        while True:
+            message = await outbox.get()
+            if message is None:
+                break
+            writer.write(json.dumps(message).encode() + b'\n')
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        commands = asyncio.Queue(self._queue_size)
+        outbox = asyncio.Queue(self._queue_size)
+        read_task = asyncio.create_task(self._read(reader, commands, outbox))
+        write_task = asyncio.create_task(self._write(writer, outbox))
+        try:
+            while True:
+                message = await commands.get()
+                if message is None:
+                    break
+                if message.get('cmd') != 'new':
+                    await outbox.put({'event': 'error',
+                                      'message': 'expected a new table'})
+                    continue
+                try:
+                    seats = message.get('seats', [HUMAN, 'random', 'random', 'random'])
+                    rules = Rules(int(message.get('max_value', 6)), len(seats),
+                                  draw=bool(message.get('draw', False)))
+                    table = Table(self._tables, self, seats,
+                                  int(message.get('target_score', 200)),
+                                  outbox, commands, rules)
+                except (ProtocolException, TypeError, ValueError) as error:
+                    await outbox.put({'event': 'error', 'message': str(error)})
+                    continue
+
+                self._tables += 1
+                self.active_tables += 1
+                play_task = asyncio.create_task(table.play())
+                try:
+                    # si el cliente se va, la mesa no sigue jugando sola
+                    await asyncio.wait({play_task, write_task},
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    self.active_tables -= 1
+                if not play_task.done():
+                    play_task.cancel()
+                    break
+                try:
+                    play_task.result()
+                except ConnectionResetError:
+                    raise
+                except Exception as error:
+                    # una mesa que falla no se lleva la conexion: el cliente
+                    # puede abrir otra
+                    await outbox.put({'event': 'error', 'message': 'table {} stopped:'
+                                      ' {}'.format(table.id, error)})
+        except ConnectionResetError:
+            pass
+        finally:
+            read_task.cancel()
+            await outbox.put(None)
+            try:
+                await write_task
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        if path is None:
+            server = await asyncio.start_server(self.handle, host, port)
+        else:
+            server = await asyncio.start_unix_server(self.handle, path)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de mesas de domino.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, metavar='PATH',
+                        help='escucha en un socket Unix en vez de TCP')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--executor', choices=['process', 'thread'],
+                        default='process')
+    args = parser.parse_args()
+
+    server = Server(args.workers, args.executor)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
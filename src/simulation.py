@@ -0,0 +1,228 @@
+#! /usr/bin/env python
+
+import argparse
+import collections
+import copy
+import random
+import time
+import players
+from domino import Domino
+from compact import CompactGame, PersistentGame
+from game import Game
+from rules import Rules, DOUBLE_SIX, SETS
+from search import alphabeta, iterative_deepening, MoveOrdering
+from series import Series
+
+GameRecord = collections.namedtuple(
+    'GameRecord', ['seed', 'winner', 'points', 'moves', 'decision_times', 'result'])
+
+SeriesRecord = collections.namedtuple(
+    'SeriesRecord', ['seed', 'winner', 'scores', 'games', 'moves', 'decision_times'])
+
+
+def player_by_name(name):
+    player = getattr(players, name)
+    if isinstance(player, type):
+        player = player()
+    return player
+
+
+def _winning_team(points):
+    if points > 0:
+        return 0
+    elif points < 0:
+        return 1
+    return None
+
+
+def play_game(game, game_players):
+    # mismo bucle que main.py, sin entrada ni salida
+    decision_times = [0.0] * len(game_players)
+    while game.result is None:
+        turn = game.turn
+        start = time.perf_counter()
+        game_players[turn](game)
+        decision_times[turn] += time.perf_counter() - start
+        game.make_move(*game.valid_moves[0])
+    return decision_times
+
+
+def _seed_rng(rng, seed):
+    # los jugadores aleatorios usan el modulo random, por eso tambien se
+    # siembra para que cada partida se pueda reproducir
+    rng.seed(seed)
+    random.seed(seed)
+
+
+def simulate_games(game_players, n, seed=0, starting_domino=None, rules=DOUBLE_SIX):
+    if starting_domino is None:
+        starting_domino = Domino(rules.max_value, rules.max_value)
+    rng = random.Random()
+    for i in range(n):
+        _seed_rng(rng, seed + i)
+        game = Game.new(starting_domino=starting_domino, rng=rng, rules=rules)
+        decision_times = play_game(game, game_players)
+        yield GameRecord(seed + i, _winning_team(game.result.points),
+                         game.result.points, len(game.moves),
+                         decision_times, game.result)
+
+
+def simulate_series(game_players, n, seed=0, target_score=200, rules=DOUBLE_SIX):
+    rng = random.Random()
+    for i in range(n):
+        _seed_rng(rng, seed + i)
+        series = Series(target_score=target_score, rng=rng, rules=rules)
+        game = series.games[0]
+        moves = 0
+        decision_times = [0.0] * len(game_players)
+        while game is not None:
+            for player, t in enumerate(play_game(game, game_players)):
+                decision_times[player] += t
+            moves += len(game.moves)
+            game = series.next_game()
+        winner, _ = max(enumerate(series.scores), key=lambda i_score: i_score[1])
+        yield SeriesRecord(seed + i, winner, list(series.scores),
+                           len(series.games), moves, decision_times)
+
+
+def throughput(records):
+    # consume los registros y devuelve cuantos hay por segundo
+    start = time.perf_counter()
+    n = sum(1 for _ in records)
+    return n / (time.perf_counter() - start)
+
+
+# manos pequenas para que la busqueda exacta de cada reparto sea rapida
+CHECK_RULES = (Rules(4, 2, hand_size=3), Rules(4, 3, hand_size=3),
+               Rules(4, 2, hand_size=3, draw=True))
+
+
+def check_weighted_hands(rules, seed=0, moves=1, samples=30):
+    # todos los repartos que Game.weighted_possible_hands junta en una clase
+    # tienen que dar el mismo valor y la misma mejor jugada
+    rng = random.Random(seed)
+    game = Game.new(rng=rng, rules=rules)
+    for _ in range(moves):
+        if game.result is not None:
+            return
+        game.make_move(*game.valid_moves[0])
+    if game.result is not None:
+        return
+
+    deals = game.sample_possible_hands(samples, rng)
+    classes = game.weighted_possible_hands(deals)
+    assert sum(weight for _, weight in classes) == len(deals)
+    for deal in deals:
+        same = [hands for hands, _ in classes
+                if len(game.weighted_possible_hands([hands, deal])) == 1]
+        assert len(same) == 1, 'seed {}: deal in {} classes'.format(seed, len(same))
+        expected = alphabeta(CompactGame.from_game(game, same[0]))
+        found = alphabeta(CompactGame.from_game(game, deal))
+        assert expected[1] == found[1] and expected[0][:1] == found[0][:1], \
+            'seed {}: {} != {}'.format(seed, expected, found)
+
+
+def check_budgeted_search(seed=0, moves=10, node_budget=2000):
+    # copiando estados, la profundizacion iterativa no puede mover la raiz
+    # que recibe y, con presupuesto de sobra, llega al valor exacto
+    game = Game.new(rng=random.Random(seed))
+    for _ in range(moves):
+        game.make_move(*game.valid_moves[0])
+    if game.result is not None:
+        return
+
+    root = PersistentGame.from_game(game)
+    before = (root.hands, root.left, root.right, root.length, root.turn, root.log)
+    _, expected = alphabeta(copy.copy(root), in_place=False)
+    _, found = iterative_deepening(root, node_budget=10 ** 7, in_place=False)
+    assert found == expected, 'seed {}: {} != {}'.format(seed, found, expected)
+    after = (root.hands, root.left, root.right, root.length, root.turn, root.log)
+    assert after == before, 'seed {}: the root was moved'.format(seed)
+
+    player = players.probabilistic_alphabeta(sample_size=20, persistent=True,
+                                             seed=seed, node_budget=node_budget)
+    player(game)
+
+
+def check_workers(seed=0, moves=2, node_budget=20000, workers=3):
+    # con las mismas muestras, el movimiento elegido no depende de cuantos
+    # procesos buscan los repartos
+    game = Game.new(rng=random.Random(seed))
+    for _ in range(moves):
+        game.make_move(*game.valid_moves[0])
+    if game.result is not None or len(game.valid_moves) == 1:
+        return
+
+    chosen = []
+    for n in (1, workers):
+        game_copy = copy.deepcopy(game)
+        player = players.probabilistic_alphabeta(
+            sample_size=12, seed=seed, workers=n, node_budget=node_budget,
+            ordering=MoveOrdering())
+        player(game_copy)
+        chosen.append(game_copy.valid_moves[0])
+    assert chosen[0] == chosen[1], 'seed {}: {} != {}'.format(seed, *chosen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simula partidas sin interfaz.')
+    parser.add_argument('players', nargs='*',
+                        help='nombre de los jugadores en players.py, de 2 a 4')
+    parser.add_argument('-n', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--series', action='store_true')
+    parser.add_argument('--target-score', type=int, default=200)
+    parser.add_argument('--set', choices=SETS, default='double-six')
+    parser.add_argument('--draw', action='store_true',
+                        help='quien no puede jugar roba del monton')
+    parser.add_argument('--check-search', action='store_true',
+                        help='comprueba la busqueda de los jugadores y'
+                             ' termina')
+    parser.add_argument('--check-deals', action='store_true',
+                        help='comprueba que los repartos equivalentes dan el'
+                             ' mismo resultado y termina')
+    args = parser.parse_args()
+
+    if args.check_search:
+        for seed in range(args.seed, args.seed + args.n):
+            check_budgeted_search(seed)
+            check_workers(seed)
+        print('Budgeted searches leave their root where it was and choose'
+              ' the same move with any number of workers.')
+        return
+
+    if args.check_deals:
+        for rules in CHECK_RULES:
+            for seed in range(args.seed, args.seed + args.n):
+                for moves in (1, 3):
+                    check_weighted_hands(rules, seed, moves)
+        print('Equivalent deals have the same value and best move.')
+        return
+
+    try:
+        rules = Rules(SETS[args.set], len(args.players), draw=args.draw)
+    except ValueError as error:
+        parser.error(str(error))
+
+    game_players = [player_by_name(name) for name in args.players]
+    if args.series:
+        records = simulate_series(game_players, args.n, args.seed,
+                                  args.target_score, rules)
+    else:
+        records = simulate_games(game_players, args.n, args.seed, rules=rules)
+
+    wins = collections.Counter()
+    start = time.perf_counter()
+    for record in records:
+        wins[record.winner] += 1
+    elapsed = time.perf_counter() - start
+
+    for team in (0, 1):
+        print('Team {} won {} of {}.'.format(team, wins[team], args.n))
+    if wins[None]:
+        print('{} tied.'.format(wins[None]))
+    print('{:.1f} per second'.format(args.n / elapsed))
+
+
+if __name__ == '__main__':
+    main()
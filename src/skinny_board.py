@@ -1,5 +1,6 @@
 from exceptions import EmptyBoardException, EndsMismatchException
 from domino import Domino
+import zobrist
 
 
 class SkinnyBoard:
@@ -71,6 +72,23 @@ class SkinnyBoard:
         else:
             self._add_right(d)
 
+    def remove(self, d, left):
+        if not self:
+            raise EmptyBoardException('Cannot remove {} from the board'
+                                      ' because it is empty!'.format(d))
+
+        self._length -= 1
+        if not self:
+            self._left = None
+            self._right = None
+        elif left:
+            self._left = d.second if self._left == d.first else d.first
+        else:
+            self._right = d.second if self._right == d.first else d.first
+
+    def zobrist_hash(self):
+        return zobrist.ends_hash(self._left, self._right)
+
     def __eq__(self, other):
         if not isinstance(other, type(self)):
             return False
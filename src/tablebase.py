@@ -0,0 +1,311 @@
+#! /usr/bin/env python
+
+import argparse
+import array
+import bisect
+import mmap
+import struct
+from compact import (ALL_DOMINOES, DOMINOES, PIPS, VALUE_MASKS, LEFT_MOVES,
+                     RIGHT_MOVES, hand_mask)
+from rules import DOUBLE_SIX
+
+# Una posicion (extremos, manos y turno) se guarda con el turno rotado al
+# jugador 0 y los extremos ordenados (izquierdo <= derecho). Rotar un
+# jugador intercambia los equipos y cambia el signo del valor; cambiar
+# los extremos de lado solo cambia el lado de la mejor jugada.
+#
+# Clave de 64 bits: un bloque de 7 bits por ficha, (indice + 1) << 2 | dueño,
+# en orden creciente de indice y empezando por los bits altos, rellenado
+# hasta 8 fichas, y al final extremo izquierdo (3 bits), derecho (3 bits)
+# y turno (2 bits, siempre 0).
+#
+# Fichero: cabecera (magia, maximo de fichas), un directorio con el
+# desplazamiento y numero de posiciones de cada seccion (una por numero
+# de fichas) y en cada seccion las claves ordenadas, los valores (int16)
+# y la mejor jugada (indice << 1 | izquierda).
+
+MAGIC = b'DTB1'
+HEADER = struct.Struct('<4sB3x')
+SECTION = struct.Struct('<QQ')
+MAX_DOMINOES = 8
+DEFAULT_MAX_DOMINOES = 4
+PLAYERS = 4
+
+# valores que aparecen una vez en cada ficha (ninguno en los dobles)
+PARITY = [1 << d.first ^ 1 << d.second for d in DOMINOES]
+
+
+def _key(dominoes, left, right):
+    # dominoes: pares (indice, dueño) en orden creciente de indice
+    key = 0
+    for i, owner in dominoes:
+        key = key << 7 | (i + 1) << 2 | owner
+    key <<= 7 * (MAX_DOMINOES - len(dominoes))
+    return key << 8 | left << 5 | right << 2
+
+
+def _canonical(hands, left, right, turn):
+    # devuelve la clave, el signo del valor y si se cambiaron los extremos
+    dominoes = []
+    for player, hand in enumerate(hands):
+        owner = (player - turn) % PLAYERS
+        while hand:
+            low = hand & -hand
+            dominoes.append((low.bit_length() - 1, owner))
+            hand ^= low
+    dominoes.sort()
+
+    swapped = left > right
+    if swapped:
+        left, right = right, left
+    sign = -1 if turn % 2 else 1
+    return _key(dominoes, left, right), sign, swapped
+
+
+def _stuck_value(hands):
+    points = [sum(PIPS[i] for i in range(len(DOMINOES)) if hand >> i & 1)
+              for hand in hands]
+    team_points = [points[0] + points[2], points[1] + points[3]]
+    if team_points[0] < team_points[1]:
+        return sum(team_points)
+    elif team_points[0] == team_points[1]:
+        return 0
+    return -sum(team_points)
+
+
+class _Section:
+    def __init__(self, keys, values, moves):
+        self.keys = keys
+        self.values = values
+        self.moves = moves
+
+    def find(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        return i
+
+
+def _move_value(hands, left, right, i, on_left, lookup):
+    # valor (para el equipo 0) tras jugar la ficha i el jugador 0
+    hands = list(hands)
+    hands[0] ^= 1 << i
+    if not hands[0]:
+        return sum(PIPS[j] for j in range(len(DOMINOES))
+                   if any(hand >> j & 1 for hand in hands))
+
+    if on_left:
+        left = PIPS[i] - left
+    else:
+        right = PIPS[i] - right
+    ends = VALUE_MASKS[left] | VALUE_MASKS[right]
+    for turn in (1, 2, 3, 0):
+        if hands[turn] & ends:
+            break
+    else:
+        return _stuck_value(hands)
+
+    key, sign, _ = _canonical(hands, left, right, turn)
+    return sign * lookup(key)
+
+
+def _positions(n):
+    # posiciones canonicas con n fichas, en orden creciente de clave, con
+    # los extremos que pueden tener: en la mesa cada valor aparece un numero
+    # par de veces salvo en los extremos, asi que los valores que aparecen
+    # un numero impar de veces en las manos son justo los extremos
+    dominoes = []
+    hands = [0] * PLAYERS
+
+    def _place(start, parity):
+        if len(dominoes) == n:
+            if all(hands):
+                for ends in _ends(hands, parity):
+                    yield dominoes, hands, ends
+            return
+
+        # cada jugador necesita al menos una ficha (si no, la partida acabo)
+        empty = sum(1 for hand in hands if not hand)
+        if n - len(dominoes) < empty:
+            return
+
+        for i in range(start, len(DOMINOES) - (n - len(dominoes)) + 1):
+            for owner in range(PLAYERS):
+                dominoes.append((i, owner))
+                hands[owner] |= 1 << i
+                yield from _place(i + 1, parity ^ PARITY[i])
+                hands[owner] ^= 1 << i
+                dominoes.pop()
+
+    return _place(0, 0)
+
+
+def _ends(hands, parity):
+    values = [v for v in range(7) if parity >> v & 1]
+    if len(values) == 2:
+        candidates = [tuple(values)]
+    elif not values:
+        candidates = [(v, v) for v in range(7)]
+    else:
+        return []
+
+    # ademas cada extremo tiene que estar en alguna ficha de la mesa
+    board = ALL_DOMINOES ^ (hands[0] | hands[1] | hands[2] | hands[3])
+    return [(left, right) for left, right in candidates
+            if board & VALUE_MASKS[left] and board & VALUE_MASKS[right]]
+
+
+def generate(path, max_dominoes=DEFAULT_MAX_DOMINOES):
+    if not PLAYERS <= max_dominoes <= MAX_DOMINOES:
+        raise ValueError('max_dominoes must be between {} and {}'.format(
+            PLAYERS, MAX_DOMINOES))
+
+    sections = {}
+
+    def lookup(key):
+        section = sections[len_of_key(key)]
+        return section.values[section.find(key)]
+
+    for n in range(PLAYERS, max_dominoes + 1):
+        keys = array.array('Q')
+        values = array.array('h')
+        moves = array.array('B')
+        for dominoes, hands, (left, right) in _positions(n):
+            hand = hands[0]
+            left_mask = hand & VALUE_MASKS[left]
+            right_mask = hand & VALUE_MASKS[right] if left != right else 0
+            if not left_mask | right_mask:
+                continue
+
+            best_value = None
+            mask = left_mask | right_mask
+            while mask:
+                low = mask & -mask
+                i = low.bit_length() - 1
+                for on_left, side_mask in ((True, left_mask), (False, right_mask)):
+                    if not side_mask & low:
+                        continue
+                    value = _move_value(hands, left, right, i, on_left, lookup)
+                    if best_value is None or value > best_value:
+                        best_value = value
+                        best_move = i << 1 | on_left
+                mask ^= low
+
+            keys.append(_key(dominoes, left, right))
+            values.append(best_value)
+            moves.append(best_move)
+        sections[n] = _Section(keys, values, moves)
+
+    _write(path, max_dominoes, sections)
+
+
+def len_of_key(key):
+    # numero de fichas de una clave: bloques de 7 bits distintos de cero
+    key >>= 8
+    n = MAX_DOMINOES
+    while n and not key & 0x7f:
+        key >>= 7
+        n -= 1
+    return n
+
+
+def _write(path, max_dominoes, sections):
+    offset = HEADER.size + SECTION.size * (max_dominoes + 1)
+    directory = []
+    for n in range(max_dominoes + 1):
+        count = len(sections[n].keys) if n in sections else 0
+        directory.append((offset, count))
+        offset += 11 * count
+        offset += -offset % 8
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, max_dominoes))
+        for entry in directory:
+            f.write(SECTION.pack(*entry))
+        for n, (offset, count) in enumerate(directory):
+            if not count:
+                continue
+            f.seek(offset)
+            section = sections[n]
+            f.write(section.keys.tobytes())
+            f.write(section.values.tobytes())
+            f.write(section.moves.tobytes())
+
+
+class Tablebase:
+    '''
+    Read-only view of a generated tablebase. The file is memory-mapped
+    and probed by binary search, so it is never loaded as a whole.
+    '''
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_dominoes = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError('{} is not a tablebase file'.format(path))
+
+        view = memoryview(self._map)
+        self._sections = {}
+        for n in range(self.max_dominoes + 1):
+            offset, count = SECTION.unpack_from(
+                self._map, HEADER.size + SECTION.size * n)
+            if not count:
+                continue
+            keys = view[offset:offset + 8 * count].cast('Q')
+            offset += 8 * count
+            values = view[offset:offset + 2 * count].cast('h')
+            offset += 2 * count
+            moves = view[offset:offset + count]
+            self._sections[n] = _Section(keys, values, moves)
+
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, game):
+        # (jugadas, valor) como los devuelve alphabeta, o None si la
+        # posicion no esta en la tabla
+        if game.result is not None or game.remaining_dominoes() > self.max_dominoes:
+            return None
+        # las tablas son del doble seis a cuatro jugadores
+        if game.rules != DOUBLE_SIX:
+            return None
+
+        self.probes += 1
+        hands = game.hands
+        if not isinstance(hands[0], int):
+            hands = [hand_mask(hand) for hand in hands]
+        left, right = game.ends()
+        key, sign, swapped = _canonical(hands, left, right, game.turn)
+        section = self._sections.get(len_of_key(key))
+        if section is None:
+            return None
+        i = section.find(key)
+        if i is None:
+            return None
+
+        self.hits += 1
+        move = section.moves[i]
+        on_left = bool(move & 1) != swapped
+        d = move >> 1
+        return [LEFT_MOVES[d] if on_left else RIGHT_MOVES[d]], sign * section.values[i]
+
+    def close(self):
+        for section in self._sections.values():
+            section.keys.release()
+            section.values.release()
+            section.moves.release()
+        self._sections = {}
+        self._map.close()
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera la tabla de finales.')
+    parser.add_argument('path')
+    parser.add_argument('--max-dominoes', type=int, default=DEFAULT_MAX_DOMINOES)
+    args = parser.parse_args()
+    generate(args.path, args.max_dominoes)
+
+
+if __name__ == '__main__':
+    main()
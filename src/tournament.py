@@ -0,0 +1,188 @@
+#! /usr/bin/env python
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import math
+import os
+from simulation import player_by_name, simulate_series
+
+Task = collections.namedtuple('Task', ['id', 'teams', 'seed', 'n', 'target_score'])
+
+# estrategias de los equipos 0 y 1 y puntuaciones finales de una serie
+Outcome = collections.namedtuple('Outcome', ['teams', 'scores'])
+
+
+def schedule(strategies, n, seed=0, target_score=200, chunk_size=10):
+    # cada pareja juega en los dos lados de la mesa, asi ninguna se
+    # beneficia de la posicion; las series se reparten en tareas pequeñas
+    tasks = []
+    for a, b in itertools.combinations(strategies, 2):
+        for teams in ((a, b), (b, a)):
+            for start in range(0, n, chunk_size):
+                tasks.append(Task(len(tasks), teams, seed + start,
+                                  min(chunk_size, n - start), target_score))
+    return tasks
+
+
+def play_task(task):
+    team_0, team_1 = task.teams
+    game_players = [player_by_name(team_0), player_by_name(team_1),
+                    player_by_name(team_0), player_by_name(team_1)]
+    return [Outcome(task.teams, record.scores)
+            for record in simulate_series(game_players, task.n, task.seed,
+                                          task.target_score)]
+
+
+def load_checkpoint(path):
+    # resultados por tarea completa, no solo por id: una entrada de otro
+    # torneo con el mismo id no coincide y esa tarea se vuelve a jugar
+    outcomes = {}
+    if not os.path.exists(path):
+        return outcomes
+
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                task = Task(entry['task'], tuple(entry['teams']), entry['seed'],
+                            entry['n'], entry['target_score'])
+            except (KeyError, TypeError, ValueError):
+                # la ultima linea puede quedar a medias si se mato el proceso
+                continue
+            outcomes[task] = [Outcome(tuple(o['teams']), o['scores'])
+                              for o in entry['outcomes']]
+    return outcomes
+
+
+def _save(f, task, outcomes):
+    f.write(json.dumps({
+        'task': task.id,
+        'teams': task.teams,
+        'seed': task.seed,
+        'n': task.n,
+        'target_score': task.target_score,
+        'outcomes': [{'teams': o.teams, 'scores': o.scores} for o in outcomes],
+    }) + '\n')
+    f.flush()
+
+
+def _open_checkpoint(path):
+    f = open(path, 'a+')
+    # si la ultima linea quedo a medias, las nuevas empiezan en otra linea
+    if f.tell():
+        f.seek(f.tell() - 1)
+        if f.read(1) != '\n':
+            f.write('\n')
+    return f
+
+
+def run(tasks, workers=None, checkpoint=None):
+    done = {} if checkpoint is None else load_checkpoint(checkpoint)
+    pending = [task for task in tasks if task not in done]
+
+    f = None if checkpoint is None else _open_checkpoint(checkpoint)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(play_task, task): task for task in pending}
+            for future in concurrent.futures.as_completed(futures):
+                task = futures[future]
+                done[task] = future.result()
+                if f is not None:
+                    _save(f, task, done[task])
+    finally:
+        if f is not None:
+            f.close()
+
+    return [outcome for task in tasks for outcome in done[task]]
+
+
+def wilson_interval(wins, n, z=1.96):
+    if not n:
+        return 0.0, 1.0
+    p = wins / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return center - margin, center + margin
+
+
+def win_rates(outcomes):
+    # victorias y series de cada estrategia contra cada rival
+    wins = collections.Counter()
+    played = collections.Counter()
+    for outcome in outcomes:
+        winner = 0 if outcome.scores[0] >= outcome.scores[1] else 1
+        a, b = outcome.teams
+        played[a, b] += 1
+        played[b, a] += 1
+        wins[outcome.teams[winner], outcome.teams[1 - winner]] += 1
+
+    rates = {}
+    for (a, b), n in played.items():
+        rates[a, b] = (wins[a, b] / n, wilson_interval(wins[a, b], n), n)
+    return rates
+
+
+def ratings(outcomes, iterations=1000, base=1500):
+    # modelo de Bradley-Terry ajustado con el algoritmo MM y expresado en
+    # la escala de Elo; a diferencia de Elo secuencial no depende del orden
+    wins = collections.Counter()
+    games = collections.Counter()
+    strategies = set()
+    for outcome in outcomes:
+        a, b = outcome.teams
+        strategies.update((a, b))
+        games[frozenset((a, b))] += 1
+        wins[a if outcome.scores[0] >= outcome.scores[1] else b] += 1
+
+    strength = {s: 1.0 for s in strategies}
+    for _ in range(iterations):
+        new_strength = {}
+        for s in strategies:
+            denominator = sum(n / (strength[s] + strength[other])
+                              for pair, n in games.items() if s in pair
+                              for other in pair if other != s)
+            # medio partido ganado evita fuerzas nulas con 0 victorias
+            new_strength[s] = (wins[s] + 0.5) / denominator
+        total = sum(new_strength.values())
+        strength = {s: v * len(strategies) / total for s, v in new_strength.items()}
+
+    return {s: base + 400 * math.log10(v) for s, v in strength.items()}
+
+
+def report(outcomes):
+    lines = ['Rating:']
+    for s, rating in sorted(ratings(outcomes).items(), key=lambda sr: -sr[1]):
+        lines.append('  {:<28} {:7.1f}'.format(s, rating))
+
+    lines.append('Win rates (95% CI):')
+    for (a, b), (rate, (low, high), n) in sorted(win_rates(outcomes).items()):
+        lines.append('  {} vs {}: {:.1%} [{:.1%}, {:.1%}] over {} series'.format(
+            a, b, rate, low, high, n))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Torneo todos contra todos.')
+    parser.add_argument('strategies', nargs='+',
+                        help='nombre de los jugadores en players.py')
+    parser.add_argument('-n', type=int, default=100,
+                        help='series por pareja y lado de la mesa')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target-score', type=int, default=200)
+    parser.add_argument('--chunk-size', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint', default=None,
+                        help='fichero donde se guardan y retoman los resultados')
+    args = parser.parse_args()
+
+    tasks = schedule(args.strategies, args.n, args.seed,
+                     args.target_score, args.chunk_size)
+    outcomes = run(tasks, args.workers, args.checkpoint)
+    print(report(outcomes))
+
+
+if __name__ == '__main__':
+    main()
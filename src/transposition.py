@@ -0,0 +1,63 @@
+import collections
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+Entry = collections.namedtuple(
+    'Entry', ['key', 'depth', 'flag', 'value', 'moves'])
+
+# tamaño aproximado en memoria de una entrada con su variante principal
+ENTRY_SIZE = 320
+
+
+class TranspositionTable:
+    '''
+    Bounded table of search results keyed by Zobrist hash. Each slot
+    holds two entries: one kept while it is the deepest seen for that
+    slot, and one that is always replaced.
+    '''
+    def __init__(self, max_bytes=64 * 2**20):
+        self.slots = max(1, max_bytes // (2 * ENTRY_SIZE))
+        self._entries = [None] * (2 * self.slots)
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def probe(self, key):
+        self.probes += 1
+        i = 2 * (key % self.slots)
+        for entry in (self._entries[i], self._entries[i + 1]):
+            if entry is not None and entry.key == key:
+                self.hits += 1
+                return entry
+
+        return None
+
+    def store(self, key, depth, flag, value, moves):
+        self.stores += 1
+        entry = Entry(key, depth, flag, value, tuple(moves))
+        i = 2 * (key % self.slots)
+        deepest = self._entries[i]
+        if deepest is None or deepest.key == key or depth >= deepest.depth:
+            if deepest is not None and deepest.key != key:
+                self.replacements += 1
+                # la entrada desplazada pasa al hueco de reemplazo siempre
+                self._entries[i + 1] = deepest
+            self._entries[i] = entry
+        else:
+            if self._entries[i + 1] is not None:
+                self.replacements += 1
+            self._entries[i + 1] = entry
+
+    def hit_rate(self):
+        if not self.probes:
+            return 0.0
+        return self.hits / self.probes
+
+    def clear(self):
+        self._entries = [None] * (2 * self.slots)
+
+    def __len__(self):
+        return sum(entry is not None for entry in self._entries)
@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+
+import argparse
+import time
+import numpy as np
+from board import Board
+from compact import DOMINOES
+from domino import Domino
+from game import Game
+from hand import Hand
+from result import Result
+
+# misma numeracion de fichas que compact: [a|b] con a <= b es b * (b + 1) / 2 + a
+FIRST = np.array([d.first for d in DOMINOES])
+SECOND = np.array([d.second for d in DOMINOES])
+PIPS = FIRST + SECOND
+DOUBLES = FIRST == SECOND
+HAS_VALUE = np.array([(FIRST == v) | (SECOND == v) for v in range(7)])
+
+# los candidatos de cada partida son 56: las 28 fichas por la izquierda
+# y las 28 por la derecha
+CANDIDATE_PIPS = np.concatenate([PIPS, PIPS])
+CANDIDATE_DOUBLES = np.concatenate([DOUBLES, DOUBLES])
+
+
+def random_policy(rng, k):
+    return rng.random((k, 56))
+
+
+def bota_gorda_policy(rng, k):
+    # los puntos son enteros, el sumando aleatorio solo deshace empates
+    return CANDIDATE_PIPS + 0.5 * rng.random((k, 56))
+
+
+def double_policy(rng, k):
+    return CANDIDATE_DOUBLES + 0.5 * rng.random((k, 56))
+
+
+POLICIES = {
+    'random': random_policy,
+    'bota_gorda': bota_gorda_policy,
+    'double': double_policy,
+}
+
+
+class VectorizedGames:
+    '''
+    K games played in lock-step. Hands are a K x 4 x 28 boolean matrix,
+    the board is reduced to its two ends and every step plays one move
+    in each unfinished game, chosen by a policy that scores all 56
+    (domino, end) candidates at once.
+    '''
+    def __init__(self, k, rng, starting_domino=Domino(6, 6)):
+        self.k = k
+        self.rng = rng
+        self._games = np.arange(k)
+
+        order = np.argsort(rng.random((k, 28)), axis=1)
+        self.hands = np.zeros((k, 4, 28), dtype=bool)
+        for player in range(4):
+            dominoes = order[:, 7 * player:7 * (player + 1)]
+            self.hands[self._games[:, None], player, dominoes] = True
+        self.initial_hands = self.hands.copy()
+
+        self.left = np.full(k, -1)
+        self.right = np.full(k, -1)
+        self.turn = np.zeros(k, dtype=int)
+        self.done = np.zeros(k, dtype=bool)
+        self.result_player = np.full(k, -1)
+        self.result_won = np.zeros(k, dtype=bool)
+        self.result_points = np.zeros(k, dtype=int)
+        self.moves = []
+
+        start = DOMINOES.index(starting_domino)
+        self.starting_player = np.argmax(self.hands[:, :, start], axis=1)
+        self.turn[:] = self.starting_player
+        choice = np.full(k, start)
+        self._play(choice, np.ones(k, dtype=bool))
+
+    def _points(self):
+        return (self.hands * PIPS).sum(axis=2)
+
+    def _playable(self, player):
+        ends = HAS_VALUE[self.left] | HAS_VALUE[self.right]
+        return (self.hands[self._games, player] & ends).any(axis=1)
+
+    def candidates(self):
+        hand = self.hands[self._games, self.turn]
+        left = hand & HAS_VALUE[self.left]
+        right = hand & HAS_VALUE[self.right] & (self.left != self.right)[:, None]
+        return np.concatenate([left, right], axis=1) & ~self.done[:, None]
+
+    def _play(self, choice, active):
+        d = choice % 28
+        on_left = choice < 28
+        self.moves.append((np.where(active, d, -1), on_left))
+
+        games = self._games[active]
+        d = d[active]
+        on_left = on_left[active]
+        turn = self.turn[active]
+        self.hands[games, turn, d] = False
+
+        empty = self.left[games] < 0
+        left = np.where(empty, FIRST[d],
+                        np.where(on_left, PIPS[d] - self.left[games], self.left[games]))
+        right = np.where(empty, SECOND[d],
+                         np.where(on_left, self.right[games], PIPS[d] - self.right[games]))
+        self.left[games] = left
+        self.right[games] = right
+
+        points = self._points()
+        won = active & ~self.hands[self._games, self.turn].any(axis=1)
+        self.done |= won
+        self.result_player[won] = self.turn[won]
+        self.result_won[won] = True
+        self.result_points[won] = np.where(self.turn[won] % 2, -1, 1) * \
+            points[won].sum(axis=1)
+
+        # como en Game.make_move: hasta cuatro turnos buscando quien pueda
+        # jugar, y si nadie puede (ni quien acaba de jugar) se tranca
+        searching = active & ~won
+        for _ in range(4):
+            self.turn[searching] = (self.turn[searching] + 1) % 4
+            searching &= ~self._playable(self.turn)
+
+        stuck = searching
+        team_points = points[:, 0::2].sum(axis=1), points[:, 1::2].sum(axis=1)
+        total = team_points[0] + team_points[1]
+        self.done |= stuck
+        self.result_player[stuck] = self.turn[stuck]
+        self.result_points[stuck] = np.sign(team_points[1] - team_points[0])[stuck] * \
+            total[stuck]
+
+    def step(self, policies):
+        candidates = self.candidates()
+        scores = np.empty((self.k, 56))
+        for player, policy in enumerate(policies):
+            seat = self.turn == player
+            scores[seat] = policy(self.rng, self.k)[seat]
+        scores[~candidates] = -np.inf
+        choice = np.argmax(scores, axis=1)
+        self._play(choice, ~self.done)
+
+    def play(self, policies):
+        while not self.done.all():
+            self.step(policies)
+
+    def results(self):
+        return [Result(int(p), bool(w), int(points)) for p, w, points in
+                zip(self.result_player, self.result_won, self.result_points)]
+
+
+def replay(games, i):
+    # la misma partida jugada con el motor escalar
+    hands = [Hand(DOMINOES[j] for j in np.flatnonzero(games.initial_hands[i, player]))
+             for player in range(4)]
+    d, _ = games.moves[0]
+    start = DOMINOES[d[i]]
+    starting_player = int(games.starting_player[i])
+    game = Game(Board(), hands, [], starting_player, ((start, True),),
+                starting_player, None)
+    for d, on_left in games.moves:
+        if d[i] >= 0:
+            game.make_move(DOMINOES[d[i]], bool(on_left[i]))
+    return game
+
+
+def cross_check(k=1000, seed=0, policies=('random',) * 4):
+    games = VectorizedGames(k, np.random.default_rng(seed))
+    games.play([POLICIES[p] for p in policies])
+    for i, result in enumerate(games.results()):
+        scalar = replay(games, i).result
+        assert scalar == result, 'game {}: {} != {}'.format(i, result, scalar)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partidas en lote con NumPy.')
+    parser.add_argument('policies', nargs=4, choices=sorted(POLICIES))
+    parser.add_argument('-k', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true',
+                        help='compara cada resultado con Game.make_move')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games = VectorizedGames(args.k, np.random.default_rng(args.seed))
+    games.play([POLICIES[p] for p in args.policies])
+    elapsed = time.perf_counter() - start
+
+    points = games.result_points
+    print('Team 0 won {}, team 1 won {}, {} tied.'.format(
+        (points > 0).sum(), (points < 0).sum(), (points == 0).sum()))
+    print('{:.1f} games per second'.format(args.k / elapsed))
+
+    if args.check:
+        cross_check(args.k, args.seed, args.policies)
+        print('All results match the scalar engine.')
+
+
+if __name__ == '__main__':
+    main()
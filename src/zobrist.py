@@ -0,0 +1,37 @@
+import random
+
+# semilla fija para que los hashes sean iguales en todos los procesos
+_rng = random.Random(0x5eed)
+
+DOMINO_KEYS = [_rng.getrandbits(64) for _ in range(28)]
+LEFT_KEYS = [_rng.getrandbits(64) for _ in range(7)]
+RIGHT_KEYS = [_rng.getrandbits(64) for _ in range(7)]
+TURN_KEYS = [_rng.getrandbits(64) for _ in range(4)]
+# los juegos mas grandes que el doble seis, despues para no cambiar sus claves
+DOMINO_KEYS += [_rng.getrandbits(64) for _ in range(28, 91)]
+LEFT_KEYS += [_rng.getrandbits(64) for _ in range(7, 13)]
+RIGHT_KEYS += [_rng.getrandbits(64) for _ in range(7, 13)]
+
+_MASK = (1 << 64) - 1
+
+
+def domino_key(d):
+    return DOMINO_KEYS[d.id]
+
+
+def ends_hash(left, right):
+    if left is None:
+        return 0
+    return LEFT_KEYS[left] ^ RIGHT_KEYS[right]
+
+
+def player_hash(hand_hash, player):
+    # rotar el hash de la mano distingue la misma mano en distintos jugadores
+    # sin perder la actualizacion incremental (la rotacion conmuta con xor)
+    shift = 16 * player
+    return ((hand_hash << shift) | (hand_hash >> (64 - shift))) & _MASK
+
+
+def boneyard_hash(ids):
+    # el orden importa: es el orden en que se roba
+    return hash(tuple(ids)) & _MASK